@@ -0,0 +1,84 @@
+import asyncio
+import json
+import os
+from fileio import FileWorker
+
+
+# Keeps a running count of how many messages each member has sent in each channel
+# Along with the ID of the last message counted, so the next count only has to fetch newer messages
+class ActivityIndex:
+    def __init__(self, path='activity.json'):
+        self.path = path
+
+        # channel ID -> {'last': message ID, 'members': {user ID: [label, count]}}
+        self._channels = {}
+
+        # channel ID -> lock, so the same channel is never counted twice at once
+        self._locks = {}
+
+        # Saves from different channels run one at a time, in order, so they never write the file at once
+        self._worker = FileWorker()
+
+    # Load the index from its file
+    async def load(self):
+        self._channels = await self._worker.run(self._read)
+
+    def _read(self):
+        if not os.path.isfile(self.path):
+            return {}
+
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+
+        return {int(channelID): {'last': channel['last'], 'members': {int(userID): member for userID, member in channel['members'].items()}} for channelID, channel in data.items()}
+
+    # Save the index to its file
+    async def save(self):
+        # Copy it first so it can keep being updated while it's written
+        data = {str(channelID): {'last': channel['last'], 'members': {str(userID): list(member) for userID, member in channel['members'].items()}} for channelID, channel in self._channels.items()}
+        await self._worker.run(self._write, data)
+
+    def _write(self, data):
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp, self.path)
+
+    # Get the lock for a channel
+    def lock(self, channelID):
+        return self._locks.setdefault(channelID, asyncio.Lock())
+
+    def _channel(self, channelID):
+        return self._channels.setdefault(channelID, {'last': None, 'members': {}})
+
+    # Get the ID of the last message that was looked at in a channel (None if it's never been counted)
+    def checkpoint(self, channelID):
+        return self._channels.get(channelID, {}).get('last')
+
+    # Mark a message as looked at, whether or not it was counted
+    def seen(self, channelID, messageID):
+        channel = self._channel(channelID)
+        if channel['last'] is None or messageID > channel['last']:
+            channel['last'] = messageID
+
+    # Count a message from a member (the label is updated to the latest one seen)
+    def record(self, channelID, messageID, userID, label):
+        self.seen(channelID, messageID)
+
+        members = self._channel(channelID)['members']
+        if userID in members:
+            members[userID][0] = label
+            members[userID][1] += 1
+        else:
+            members[userID] = [label, 1]
+
+    # Get (label, count) for every member in a channel, sorted by count (highest first) or by name
+    def counts(self, channelID, sort='count'):
+        rows = [tuple(member) for member in self._channels.get(channelID, {}).get('members', {}).values()]
+
+        if sort == 'name':
+            rows.sort(key=lambda row: row[0].lower())
+        else:
+            rows.sort(key=lambda row: (-row[1], row[0].lower()))
+
+        return rows
@@ -0,0 +1,82 @@
+import numpy as np
+
+# Allocates NPC seats to each vote option using the largest remainder method
+#
+# Each row is one party on one bill. The NPCs in a party vote in the same proportions as the players in it:
+# every option first gets the whole number part of its quota, then whatever is left goes to the options with
+# the largest remainders. If a tie means there's no fair way to hand out what's left, those NPCs vote present.
+# If no one in a party voted at all, every NPC in it votes present.
+#
+# votes is an array of shape (rows, options) and npcs is an array of shape (rows,)
+# Returns an array of shape (rows, options) with how many NPCs vote for each option
+def apportion(votes, npcs, present=1):
+    votes = np.asarray(votes, dtype=np.int64)
+    npcs = np.maximum(np.asarray(npcs, dtype=np.int64), 0)
+
+    if votes.shape[0] == 0:
+        return np.zeros(votes.shape, dtype=np.int64)
+
+    total = votes.sum(axis=1)
+    empty = total == 0
+
+    # Get the quotas as whole numbers and remainders
+    # The remainders all share the same denominator (the party's total) so they can be compared exactly
+    quotas = npcs[:, None] * votes
+    denominator = np.where(empty, 1, total)[:, None]
+    initial = quotas // denominator
+    remainders = quotas % denominator
+
+    # Get how many NPCs are left in each row
+    left = np.where(empty, 0, npcs - initial.sum(axis=1))
+    hasLeft = left > 0
+
+    # Find the smallest remainder that would still get a seat
+    ranked = -np.sort(-remainders, axis=1)
+    cutoff = np.take_along_axis(ranked, np.maximum(left - 1, 0)[:, None], axis=1)
+
+    # Everything above the cutoff gets a seat
+    # Everything at the cutoff only gets one if there's enough to go around, otherwise those NPCs vote present
+    above = remainders > cutoff
+    tied = remainders == cutoff
+    contested = left - above.sum(axis=1)
+    fits = tied.sum(axis=1) == contested
+
+    winners = (above | (tied & fits[:, None])) & hasLeft[:, None]
+    allocation = initial + winners
+    allocation[:, present] += np.where(hasLeft & ~fits, contested, 0)
+
+    # Parties where no one voted go entirely to present
+    allocation[:, present] += np.where(empty, npcs, 0)
+
+    return allocation
+
+
+# Get the final totals for a batch of bills
+#
+# Each bill is a (votes, seats) pair: votes has shape (parties, options) with the player votes from each party
+# and seats has shape (parties,) with how many seats each of those parties has
+# Returns an array of shape (bills, options) with the player and NPC votes combined
+def billTotals(bills, options, present=1):
+    results = np.zeros((len(bills), options), dtype=np.int64)
+    if len(bills) == 0:
+        return results
+
+    # Stack every party on every bill into one array so they're all allocated at once
+    sizes = [len(votes) for votes, _ in bills]
+    votes = np.zeros((sum(sizes), options), dtype=np.int64)
+    seats = np.zeros(sum(sizes), dtype=np.int64)
+
+    row = 0
+    for (billVotes, billSeats), size in zip(bills, sizes):
+        if size > 0:
+            votes[row:row + size] = billVotes
+            seats[row:row + size] = billSeats
+        row += size
+
+    # The NPCs are whoever holds a seat but didn't vote
+    npcs = seats - votes.sum(axis=1)
+    allocation = votes + apportion(votes, npcs, present)
+
+    # Add each party's votes to the bill it belongs to
+    np.add.at(results, np.repeat(np.arange(len(bills)), sizes), allocation)
+    return results
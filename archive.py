@@ -0,0 +1,169 @@
+import json
+import math
+import re
+from fileio import FileWorker, openDatabase
+
+# Splits text into the words that are indexed
+WORD = re.compile(r'[a-z0-9]+')
+
+# Words too common to be worth indexing
+STOPWORDS = {'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with'}
+
+# Search words at least this long also match longer words that start with them ("tax" finds "taxes")
+PREFIX_LENGTH = 3
+
+# BM25 ranking parameters (how quickly repeats of a word stop counting, and how much long bills are penalised)
+K1 = 1.2
+B = 0.75
+
+
+# Get the indexed words in some text
+def tokenize(text):
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+# A closed bill in the archive
+class ArchivedBill:
+    __slots__ = ('id', 'type', 'summary', 'text', 'results', 'passed', 'introduced', 'ended', 'closed')
+
+    def __init__(self, id, type, summary, text, results, passed, introduced, ended, closed):
+        # The same key the bill had in vote storage
+        self.id = id
+        self.type = type
+        self.summary = summary
+
+        # The full text of the bill
+        self.text = text
+
+        # chamber -> {'totals': [yes, present, no], 'parties': {party: [yes, present, no]}, 'url': link to the voting message}
+        self.results = results
+
+        # Whether it passed every chamber that voted on it
+        self.passed = passed
+
+        # Unix timestamps of when the vote started, was due to end and was closed
+        self.introduced = introduced
+        self.ended = ended
+        self.closed = closed
+
+
+# Every closed bill, kept in an SQLite database with an inverted index of the words in them
+# The index is updated as each bill is added, so searching never has to scan the bills themselves
+class BillArchive:
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._worker = FileWorker()
+
+        # How many bills there are and how many words they have in total (for ranking)
+        self._bills = 0
+        self._words = 0
+
+    # Open the database (on the worker thread) the first time it's needed
+    def _connect(self):
+        if self._conn is None:
+            self._conn = openDatabase(self.path)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS bills (
+                    id INTEGER PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    results TEXT NOT NULL,
+                    passed INTEGER NOT NULL,
+                    introduced REAL,
+                    ended REAL,
+                    closed REAL NOT NULL,
+                    words INTEGER NOT NULL
+                )
+            ''')
+
+            # word -> the bills it's in and how many times
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS postings (
+                    word TEXT NOT NULL,
+                    bill INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (word, bill)
+                ) WITHOUT ROWID
+            ''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS postings_bill ON postings (bill)')
+            self._conn.commit()
+
+            self._bills, self._words = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(words), 0) FROM bills').fetchone()
+        return self._conn
+
+    # Add closed bills (adding one that's already there replaces it)
+    async def add(self, *bills):
+        await self._worker.run(self._add, bills)
+
+    def _add(self, bills):
+        conn = self._connect()
+        with conn:
+            for bill in bills:
+                words = tokenize(bill.text)
+
+                # Take out the old copy if there is one
+                old = conn.execute('SELECT words FROM bills WHERE id = ?', (bill.id,)).fetchone()
+                if old is not None:
+                    conn.execute('DELETE FROM postings WHERE bill = ?', (bill.id,))
+                    self._bills -= 1
+                    self._words -= old[0]
+
+                conn.execute(
+                    'INSERT OR REPLACE INTO bills (id, type, summary, text, results, passed, introduced, ended, closed, words) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (bill.id, bill.type, bill.summary, bill.text, json.dumps(bill.results), int(bill.passed), bill.introduced, bill.ended, bill.closed, len(words))
+                )
+
+                counts = {}
+                for word in words:
+                    counts[word] = counts.get(word, 0) + 1
+                conn.executemany('INSERT INTO postings (word, bill, count) VALUES (?, ?, ?)', [(word, bill.id, count) for word, count in counts.items()])
+
+                self._bills += 1
+                self._words += len(words)
+
+    # Find the bills that best match some search terms, best first
+    # Returns (bill, score) pairs
+    async def search(self, terms, limit=5):
+        return await self._worker.run(self._search, terms, limit)
+
+    def _search(self, terms, limit):
+        conn = self._connect()
+        words = set(tokenize(terms))
+        if len(words) == 0 or self._bills == 0:
+            return []
+
+        average = self._words / self._bills
+
+        # Rank with BM25: rarer words count for more, and so do words that make up more of a bill
+        scores = {}
+        for word in words:
+            if len(word) >= PREFIX_LENGTH:
+                rows = conn.execute('SELECT p.bill, SUM(p.count), b.words FROM postings p JOIN bills b ON b.id = p.bill WHERE p.word >= ? AND p.word < ? GROUP BY p.bill', (word, word + '\uffff')).fetchall()
+            else:
+                rows = conn.execute('SELECT p.bill, p.count, b.words FROM postings p JOIN bills b ON b.id = p.bill WHERE p.word = ?', (word,)).fetchall()
+            if len(rows) == 0:
+                continue
+
+            idf = math.log(1 + (self._bills - len(rows) + 0.5) / (len(rows) + 0.5))
+            for bill, count, length in rows:
+                scores[bill] = scores.get(bill, 0) + idf * count * (K1 + 1) / (count + K1 * (1 - B + B * length / average))
+
+        best = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+
+        results = []
+        for bill, score in best:
+            row = conn.execute('SELECT id, type, summary, text, results, passed, introduced, ended, closed FROM bills WHERE id = ?', (bill,)).fetchone()
+            results.append((ArchivedBill(row[0], row[1], row[2], row[3], json.loads(row[4]), bool(row[5]), row[6], row[7], row[8]), score))
+        return results
+
+    # Finish any pending writes and release the file
+    async def close(self):
+        await self._worker.run(self._close)
+        self._worker.shutdown()
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
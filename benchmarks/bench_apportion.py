@@ -0,0 +1,127 @@
+import math
+import os
+import random
+import sys
+import timeit
+
+# Let the script be run from anywhere
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+from apportion import billTotals
+
+# How many bills close at once in each scenario
+BILL_COUNTS = [1, 10, 50, 500]
+
+# How many parties vote on each bill
+PARTIES = 5
+
+# How many seats each party has
+SEATS = [40, 35, 25, 20, 15]
+
+
+# The original per-party allocation loop from getVotes (3 options only)
+def legacyTotals(reactions, seats):
+    totalVotes = [0, 0, 0]
+
+    for party in reactions.keys():
+        partyReact = reactions[party]
+        total = sum(partyReact)
+        npcNum = seats[party] - total
+
+        if total == 0:
+            totalVotes[1] += npcNum
+            continue
+
+        totalVotes[0] += partyReact[0]
+        totalVotes[1] += partyReact[1]
+        totalVotes[2] += partyReact[2]
+
+        quotients = [npcNum * (partyReact[0] / total), npcNum * (partyReact[1] / total), npcNum * (partyReact[2] / total)]
+        initial = [math.floor(quotients[0]), math.floor(quotients[1]), math.floor(quotients[2])]
+
+        totalVotes[0] += initial[0]
+        totalVotes[1] += initial[1]
+        totalVotes[2] += initial[2]
+
+        npcsLeft = npcNum - sum(initial)
+        if npcsLeft == 0:
+            continue
+
+        decimals = [quotients[0] - initial[0], quotients[1] - initial[1], quotients[2] - initial[2]]
+
+        if npcsLeft == 3:
+            totalVotes[0] += 1
+            totalVotes[1] += 1
+            totalVotes[2] += 1
+        elif npcsLeft == 2:
+            lowestDec = min(decimals)
+            lowest = [i for i in range(3) if decimals[i] == lowestDec]
+            for i in range(3):
+                if i != lowest[0]:
+                    totalVotes[i] += 1
+            if len(lowest) > 1:
+                totalVotes[1] += len(lowest) - 1
+        elif npcsLeft == 1:
+            highestDec = max(decimals)
+            highest = [i for i in range(3) if decimals[i] == highestDec]
+            if len(highest) == 1:
+                totalVotes[highest[0]] += 1
+            else:
+                totalVotes[1] += 1
+
+    return totalVotes
+
+
+# Check if any party on a bill has tied remainders
+# The old loop broke those ties by comparing floats, so it can't be compared against there
+def hasTie(reactions, seats):
+    for party, partyReact in reactions.items():
+        total = sum(partyReact)
+        npcNum = seats[party] - total
+        remainders = [npcNum * votes % total for votes in partyReact if npcNum * votes % total != 0]
+        if len(set(remainders)) != len(remainders):
+            return True
+    return False
+
+
+# Make some random bills as {party: [yes, present, no]}
+def makeBills(count, rng):
+    bills = []
+    for _ in range(count):
+        reactions = {}
+        for party in range(PARTIES):
+            players = rng.randint(1, SEATS[party] // 2)
+            split = sorted(rng.randint(0, players) for _ in range(2))
+            reactions[party] = [split[0], split[1] - split[0], players - split[1]]
+            if sum(reactions[party]) == 0:
+                reactions[party][0] = 1
+        bills.append(reactions)
+    return bills
+
+
+def main():
+    rng = random.Random(0)
+    seats = dict(enumerate(SEATS))
+
+    # Make sure both give the same results when there aren't any ties to break
+    for reactions in makeBills(1000, rng):
+        if not hasTie(reactions, seats):
+            batch = [(list(reactions.values()), [seats[party] for party in reactions])]
+            assert billTotals(batch, 3)[0].tolist() == legacyTotals(reactions, seats), reactions
+
+    print('{:>8} {:>14} {:>14} {:>8}'.format('bills', 'legacy (ms)', 'numpy (ms)', 'speedup'))
+
+    for count in BILL_COUNTS:
+        bills = makeBills(count, rng)
+        batch = [(np.array(list(reactions.values())), np.array(SEATS)) for reactions in bills]
+
+        runs = max(1, 2000 // count)
+        legacy = timeit.timeit(lambda: [legacyTotals(reactions, seats) for reactions in bills], number=runs) / runs * 1000
+        vectorized = timeit.timeit(lambda: billTotals(batch, 3), number=runs) / runs * 1000
+
+        print('{:>8} {:>14.3f} {:>14.3f} {:>7.1f}x'.format(count, legacy, vectorized, legacy / vectorized))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,323 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+
+# In-process stand-ins for the parts of discord.py the bot uses
+# Every method that would make an API call is counted and can be given a simulated latency
+
+# Hands out increasing IDs like Discord's snowflakes
+_ids = itertools.count(100000000000000000)
+
+
+def nextID():
+    return next(_ids)
+
+
+# Raised when fetching a message that doesn't exist
+class FakeNotFound(Exception):
+    pass
+
+
+# Raised when a simulated call is rate limited, like discord.HTTPException
+class FakeRateLimited(Exception):
+    def __init__(self, route):
+        super().__init__(f'429 Too Many Requests ({route})')
+        self.status = 429
+        self.retry_after = 0
+
+
+# Counts simulated API calls by route and waits out the simulated latency
+# A share of sends can be rejected with a 429 to exercise retries
+class FakeAPI:
+    def __init__(self, latency=0, throttle=0, rng=None):
+        self.latency = latency
+        self.throttle = throttle
+        self.rng = rng
+        self.calls = Counter()
+
+    async def call(self, route):
+        self.calls[route] += 1
+        await asyncio.sleep(self.latency)
+
+        if route == 'send' and self.throttle > 0 and self.rng.random() < self.throttle:
+            self.calls['send_429'] += 1
+            raise FakeRateLimited(route)
+
+
+class FakeRole:
+    def __init__(self, id):
+        self.id = id
+
+
+class FakeUser:
+    def __init__(self, id, name, bot=False):
+        self.id = id
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+
+    def __eq__(self, other):
+        return getattr(other, 'id', None) == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeMember(FakeUser):
+    def __init__(self, id, name, roles, guild):
+        super().__init__(id, name)
+        self.roles = roles
+        self.guild = guild
+        self.nick = None
+
+
+class FakeGuild:
+    def __init__(self, id):
+        self.id = id
+        self._members = {}
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def addMember(self, name, roles):
+        member = FakeMember(nextID(), name, roles, self)
+        self._members[member.id] = member
+        return member
+
+    def get_member(self, id):
+        return self._members.get(id)
+
+
+# Passed to the raw reaction events
+class FakePayload:
+    def __init__(self, message, user, emoji, member):
+        self.guild_id = message.guild.id
+        self.channel_id = message.channel.id
+        self.message_id = message.id
+        self.user_id = user.id
+        self.emoji = emoji
+        self.member = member
+
+
+class FakeReaction:
+    def __init__(self, message, emoji):
+        self.message = message
+        self.emoji = emoji
+
+        # Everyone who reacted, in order
+        self._users = {}
+
+    @property
+    def count(self):
+        return len(self._users)
+
+    # Whether the bot has reacted with this emoji
+    @property
+    def me(self):
+        return self.message.gateway.client.user.id in self._users
+
+    # Users are fetched 100 at a time, like the real API
+    async def users(self):
+        users = list(self._users.values())
+        for i in range(0, len(users), 100):
+            await self.message.gateway.api.call('reaction_users')
+            for user in users[i:i + 100]:
+                yield user
+
+    async def remove(self, user):
+        await self.message.gateway.api.call('reaction_remove')
+        self.message.gateway.unreact(self.message, user, self.emoji)
+
+    async def clear(self):
+        await self.message.gateway.api.call('reaction_clear')
+        for user in list(self._users.values()):
+            self.message.gateway.unreact(self.message, user, self.emoji)
+
+
+class FakeMessage:
+    def __init__(self, gateway, channel, author, content):
+        self.gateway = gateway
+        self.id = nextID()
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.reactions = []
+        self.jump_url = f'https://discord.com/channels/{self.guild.id}/{channel.id}/{self.id}'
+
+    def getReaction(self, emoji, create=False):
+        for reaction in self.reactions:
+            if reaction.emoji == emoji:
+                return reaction
+
+        if not create:
+            return None
+
+        reaction = FakeReaction(self, emoji)
+        self.reactions.append(reaction)
+        return reaction
+
+    async def add_reaction(self, emoji):
+        await self.gateway.api.call('reaction_add')
+        self.gateway.react(self, self.gateway.client.user, emoji)
+
+    async def remove_reaction(self, emoji, member):
+        await self.gateway.api.call('reaction_remove')
+        self.gateway.unreact(self, member, str(emoji))
+
+    async def clear_reaction(self, emoji):
+        reaction = self.getReaction(str(emoji))
+        await self.gateway.api.call('reaction_clear')
+        if reaction is not None:
+            for user in list(reaction._users.values()):
+                self.gateway.unreact(self, user, reaction.emoji)
+
+    async def delete(self):
+        await self.gateway.api.call('delete')
+        self.channel.messages.pop(self.id, None)
+
+    async def reply(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakeChannel:
+    def __init__(self, gateway, id, guild):
+        self.gateway = gateway
+        self.id = id
+        self.guild = guild
+        self.messages = {}
+
+        # Everything the bot has sent to this channel
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        await self.gateway.api.call('send')
+        message = FakeMessage(self.gateway, self, self.gateway.client.user, content or '')
+        self.messages[message.id] = message
+        self.sent.append(message)
+        return message
+
+    async def fetch_message(self, id):
+        await self.gateway.api.call('fetch_message')
+        if id not in self.messages:
+            raise FakeNotFound(f'Unknown message {id}')
+        return self.messages[id]
+
+    def get_partial_message(self, id):
+        return self.messages[id]
+
+    async def history(self, limit=None, after=None, oldest_first=None):
+        messages = sorted(self.messages.values(), key=lambda message: message.id)
+        if after is not None:
+            messages = [message for message in messages if message.id > after.id]
+        if not oldest_first:
+            messages.reverse()
+
+        for i in range(0, len(messages), 100):
+            await self.gateway.api.call('history')
+            for message in messages[i:i + 100]:
+                yield message
+
+    def typing(self):
+        return _Typing()
+
+
+class FakeClient:
+    def __init__(self, user):
+        self.user = user
+        self.guilds = []
+        self.channels = {}
+
+    def get_channel(self, id):
+        return self.channels.get(id)
+
+
+# Plays the part of the Discord gateway: delivers events to the bot's handlers like discord.py would
+# Each event runs as its own task, and the time from delivery to the handler finishing is recorded
+class FakeGateway:
+    def __init__(self, bot, api):
+        self.bot = bot
+        self.api = api
+        self.client = FakeClient(FakeUser(nextID(), 'PolSimBot', bot=True))
+
+        # handler name -> list of seconds from delivery to finishing
+        self.latencies = {}
+
+        # handler name -> number of errors
+        self.errors = Counter()
+
+        self._tasks = set()
+
+    def addGuild(self):
+        guild = FakeGuild(nextID())
+        self.client.guilds.append(guild)
+        return guild
+
+    def addChannel(self, id, guild):
+        channel = FakeChannel(self, id, guild)
+        self.client.channels[id] = channel
+        return channel
+
+    # Deliver an event to the bot
+    def dispatch(self, name, *args):
+        handler = getattr(self.bot, name, None)
+        if handler is None:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._run(name, handler, args, time.perf_counter()))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, name, handler, args, start):
+        try:
+            await handler(*args)
+        except Exception as e:
+            if self.errors[name] < 3:
+                print(f'{name} raised {e!r}')
+            self.errors[name] += 1
+        finally:
+            self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    # Wait for every delivered event to be handled
+    async def drain(self):
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks))
+
+    # A user sends a message
+    def message(self, channel, author, content):
+        message = FakeMessage(self, channel, author, content)
+        channel.messages[message.id] = message
+        self.dispatch('on_message', message)
+        return message
+
+    # A user adds a reaction
+    def react(self, message, user, emoji):
+        reaction = message.getReaction(emoji, create=True)
+        if user.id in reaction._users:
+            return
+
+        reaction._users[user.id] = user
+        member = message.guild.get_member(user.id) or (user if user == self.client.user else None)
+        self.dispatch('on_raw_reaction_add', FakePayload(message, user, emoji, member))
+        self.dispatch('on_reaction_add', reaction, member or user)
+
+    # A reaction is taken away
+    def unreact(self, message, user, emoji):
+        reaction = message.getReaction(emoji)
+        if reaction is None or reaction._users.pop(user.id, None) is None:
+            return
+
+        if reaction.count == 0:
+            message.reactions.remove(reaction)
+
+        self.dispatch('on_raw_reaction_remove', FakePayload(message, user, emoji, None))
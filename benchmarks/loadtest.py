@@ -0,0 +1,332 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+
+# Let the script be run from anywhere
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from fakes import FakeAPI, FakeGateway, FakeRole
+
+# IDs used for the roles and channels the bot reads from the environment
+FAKE_ENV = {
+    'DISCORD_TOKEN': 'loadtest',
+    'ADMIN_ROLE': '1',
+    'MOD_ROLE': '2',
+    'SENATOR_ROLE': '3',
+    'REP_ROLE': '4',
+    'PRESIDENT_ROLE': '5',
+    'VP_ROLE': '6',
+    'NR_ROLE': '7',
+    'DEM_ROLE': '8',
+    'CON_ROLE': '9',
+    'PDU_ROLE': '10',
+    'IND_ROLE': '11',
+    'SENATE_VOTING': '100',
+    'HOUSE_VOTING': '101',
+    'LEGISLATIVE_RECORD': '102',
+    'ELECTION_RESULTS_CHANNEL': '103'
+}
+
+# How many NPC seats each party gets on top of its players
+NPC_SEATS = 10
+
+
+# Get a percentile of a list of numbers
+def percentile(values, pct):
+    if len(values) == 0:
+        return 0
+    values = sorted(values)
+    return values[min(int(len(values) * pct / 100), len(values) - 1)]
+
+
+# Print what happened during one phase of the test
+def report(name, seconds, events, gateway, calls):
+    print(f'\n== {name}: {events} events in {seconds:.2f}s ({events / max(seconds, 1e-9):.0f}/s)')
+
+    print('  {:<26} {:>8} {:>10} {:>10} {:>8}'.format('handler', 'events', 'p50 ms', 'p99 ms', 'errors'))
+    for handler, latencies in sorted(gateway.latencies.items()):
+        print('  {:<26} {:>8} {:>10.3f} {:>10.3f} {:>8}'.format(handler, len(latencies), percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, gateway.errors[handler]))
+
+    print('  {:<26} {:>8}'.format('simulated API call', 'count'))
+    for route, count in sorted(calls.items()):
+        print('  {:<26} {:>8}'.format(route, count))
+
+    gateway.latencies.clear()
+    gateway.errors.clear()
+
+
+# Run one phase and report on it
+async def phase(name, gateway, func, sim):
+    before = Counter(gateway.api.calls)
+    start = time.perf_counter()
+
+    events = await func()
+
+    # Wait for the events and any reaction removals they queued (which can queue more events)
+    while True:
+        await gateway.drain()
+        await sim.moderation.join()
+        if not gateway._tasks:
+            break
+
+    report(name, time.perf_counter() - start, events, gateway, gateway.api.calls - before)
+
+
+async def run(args, bot):
+    from ratelimit import RouteLimiter
+    from loopwatch import LoopWatchdog
+
+    rng = random.Random(args.seed)
+
+    # Find out what blocks the event loop while the bot is under load
+    watchdog = None
+    if args.watchdog > 0:
+        watchdog = LoopWatchdog(args.watchdog / 1000)
+        watchdog.start()
+    gateway = FakeGateway(bot, FakeAPI(args.latency / 1000, args.throttle, rng))
+
+    # Build the server
+    guild = gateway.addGuild()
+    sim = bot.guildFor(guild.id)
+    senate = gateway.addChannel(sim.config.senateVoting, guild)
+    house = gateway.addChannel(sim.config.houseVoting, guild)
+    gateway.addChannel(sim.config.legislativeRecord, guild)
+
+    roles = {name: FakeRole(sim.config.roles[name]) for name in ['ADMIN', 'SENATOR', 'REP'] + bot.PARTIES}
+    sponsor = guild.addMember('Sponsor', [roles['ADMIN']])
+
+    members = {'senate': [], 'house': []}
+    seats = {'senate': Counter(), 'house': Counter()}
+    for chamber, count, role in [('senate', args.senators, 'SENATOR'), ('house', args.reps, 'REP')]:
+        for i in range(count):
+            party = rng.choice(bot.PARTIES)
+            members[chamber].append(guild.addMember(f'{role.title()} {i}', [roles[role], roles[party]]))
+            seats[chamber][party] += 1
+    outsiders = [guild.addMember(f'Citizen {i}', []) for i in range(args.outsiders)]
+
+    with open('congress_config.csv', 'w') as f:
+        f.write('CHAMBER,' + ','.join(bot.PARTIES) + '\n')
+        for chamber in ['senate', 'house']:
+            f.write(chamber.title() + ',' + ','.join(str(seats[chamber][party] + NPC_SEATS) for party in bot.PARTIES) + '\n')
+
+    # Point the bot at the fake server
+    bot.client = gateway.client
+    await sim.open('sqlite')
+    sim.roleIndex.seed(guild.members)
+    sim.congress.refresh(force=True)
+
+    # Role changes reach the slim member cache as raw gateway frames (JSON text), so send one giving an outsider a seat and one taking it away
+    def memberUpdate(member, roles, nick):
+        return json.dumps({'op': 0, 's': 1, 't': 'GUILD_MEMBER_UPDATE', 'd': {'guild_id': str(guild.id), 'roles': [str(role.id) for role in roles], 'nick': nick, 'user': {'id': str(member.id), 'username': member.name}}})
+
+    newcomer = outsiders[0]
+    await bot.on_socket_raw_receive(memberUpdate(newcomer, [roles['REP'], roles['DEM']], 'Newcomer'))
+    joined = sim.roleIndex.has(newcomer.id, 'REP') and sim.roleIndex.name(newcomer.id) == 'Newcomer' and bot.partyOf(sim, newcomer.id) == 'DEM'
+    await bot.on_socket_raw_receive(memberUpdate(newcomer, [], None))
+    left = not sim.roleIndex.has(newcomer.id, 'REP')
+    print(f'  raw member updates applied: {joined and left}')
+    if not args.rate_limits:
+        sim.limiter = RouteLimiter(bot.CLOSE_CONCURRENCY, limits=None, observer=bot.observeApiCall)
+        sim.outbox.limiter = sim.limiter
+        sim.moderation.limiter = sim.limiter
+
+    # Introduce the bills
+    def billText(i):
+        return f'Bill {i}: ' + ' '.join(rng.choice(['tax', 'reform', 'act', 'of', 'the', 'people']) for _ in range(30))
+
+    async def introduce():
+        if args.batch > 1:
+            # Introduce them with !votebatch
+            for i in range(0, args.bills, args.batch):
+                gateway.message(senate, sponsor, '!votebatch\n' + '\n---\n'.join(billText(j) for j in range(i, min(i + args.batch, args.bills))))
+                await gateway.drain()
+        else:
+            for i in range(args.bills):
+                gateway.message(senate, sponsor, '!vote ' + billText(i))
+                await gateway.drain()
+        return args.bills
+
+    await phase(f'introduce {args.bills} bills', gateway, introduce, sim)
+
+    bills = list(sim.votes)
+
+    # Vote on them
+    async def react():
+        interval = 60 / args.rate if args.rate > 0 else 0
+        start = time.perf_counter()
+
+        for i in range(args.reactions):
+            vote = rng.choice(bills)
+            chamber = rng.choice(vote.chambers())
+            channel = senate if chamber == 'senate' else house
+            message = channel.messages[vote.messageIDs[chamber]]
+
+            roll = rng.random()
+            if roll < args.invalid:
+                # Someone who can't vote in this chamber
+                gateway.react(message, rng.choice(outsiders), rng.choice(bot.VOTE_EMOJIS))
+            elif roll < args.invalid * 1.5:
+                # An emoji that isn't a vote
+                gateway.react(message, rng.choice(members[chamber]), '🎉')
+            else:
+                gateway.react(message, rng.choice(members[chamber]), rng.choice(bot.VOTE_EMOJIS))
+
+            # Keep to the requested rate
+            if interval > 0:
+                delay = start + (i + 1) * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif i % 100 == 0:
+                await asyncio.sleep(0)
+
+        return args.reactions
+
+    await phase(f'{args.reactions} reactions', gateway, react, sim)
+
+    # A raid: everyone without a chamber role piles reactions onto a message that isn't a bill and onto an open bill
+    async def raid():
+        spam = gateway.message(senate, outsiders[0], 'spam')
+        target = senate.messages[bills[0].messageIDs['senate']] if 'senate' in bills[0].chambers() else None
+
+        events = 0
+        for user in outsiders:
+            for emoji in [bot.VOTE_EMOJIS[0], '🎉']:
+                gateway.react(spam, user, emoji)
+                events += 1
+            if target is not None:
+                gateway.react(target, user, bot.VOTE_EMOJIS[2])
+                events += 1
+            await asyncio.sleep(0)
+        return events
+
+    if args.raid:
+        await phase(f'raid by {len(outsiders)} members', gateway, raid, sim)
+
+    # Forecast every open bill, with a new vote on one bill between each forecast (so only that bill is simulated again)
+    async def forecast():
+        for i in range(args.forecasts):
+            gateway.message(senate, sponsor, '!forecast')
+            await gateway.drain()
+
+            vote = rng.choice(bills)
+            chamber = rng.choice(vote.chambers())
+            channel = senate if chamber == 'senate' else house
+            gateway.react(channel.messages[vote.messageIDs[chamber]], rng.choice(members[chamber]), rng.choice(bot.VOTE_EMOJIS))
+            await gateway.drain()
+        return args.forecasts
+
+    if args.forecasts > 0:
+        await phase(f'{args.forecasts} forecasts', gateway, forecast, sim)
+        print(f'  bills with a cached forecast: {len(sim.forecasts)}')
+        if args.show_record:
+            print(senate.sent[-1].content[:600])
+
+    # Restart reconciliation
+    live = {(chamber, vote.messageIDs[chamber]): dict(sim.tallies.voters(chamber, vote.messageIDs[chamber])) for vote in bills for chamber in vote.chambers()}
+
+    async def reconcile():
+        await bot.reconcileTallies(sim)
+        return len(bills)
+
+    await phase(f'reconcile {len(bills)} bills', gateway, reconcile, sim)
+
+    # The live tallies should match what's actually on the messages
+    mismatched = sum(1 for (chamber, messageID), voters in live.items() if sim.tallies.voters(chamber, messageID) != voters)
+    print(f'  live tallies that didn\'t match the reactions: {mismatched}')
+
+    # End every vote at once
+    async def expire():
+        past = time.time() - 1
+        for vote in bills:
+            sim.votes.remove(vote)
+            vote.endTime = past
+            sim.votes.add(vote)
+
+        await bot.closeVotes(sim)
+        return len(bills)
+
+    await phase(f'close {len(bills)} bills at once', gateway, expire, sim)
+
+    # Search the archive of the bills that just closed
+    async def search():
+        for i in range(args.searches):
+            gateway.message(senate, sponsor, '!searchbills ' + ' '.join(rng.choice(['tax', 'reform', 'act', 'people', f'{rng.randrange(args.bills)}']) for _ in range(2)))
+            await gateway.drain()
+        return args.searches
+
+    if args.searches > 0:
+        await phase(f'{args.searches} archive searches', gateway, search, sim)
+
+    # Every vote in the live tallies should have made it into the voting record
+    recorded = sum(totals['voted'] for totals in (sim.record.member(member.id) for member in guild.members) if totals is not None)
+    print(f'  votes in the voting record: {recorded} (live tallies had {sum(len(voters) for voters in live.values())})')
+
+    # Look up members' voting records and party cohesion
+    async def lookups():
+        everyone = members['senate'] + members['house']
+        for i in range(args.lookups):
+            if i % 2 == 0:
+                gateway.message(senate, sponsor, f'!record <@{rng.choice(everyone).id}>')
+            else:
+                gateway.message(senate, sponsor, '!cohesion ' + rng.choice(bot.PARTIES))
+            await gateway.drain()
+        return args.lookups
+
+    if args.lookups > 0:
+        await phase(f'{args.lookups} !record and !cohesion lookups', gateway, lookups, sim)
+
+    record = gateway.client.get_channel(sim.config.legislativeRecord)
+    print(f'  legislative record messages: {len(record.sent)} (longest {max((len(message.content) for message in record.sent), default=0)} characters)')
+    if args.show_record and record.sent:
+        print(record.sent[0].content)
+
+    await sim.storage.close()
+
+    if watchdog is not None:
+        watchdog.stop()
+        print('\n== event loop stalls over {:.0f}ms'.format(args.watchdog))
+        for where, count, total, longest in watchdog.offenders(10):
+            print('  {:>5}x {:>8.0f}ms total {:>8.0f}ms max  {}'.format(count, total * 1000, longest * 1000, where))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Exercise the bot against a fake Discord server and report how it performs')
+    parser.add_argument('--bills', type=int, default=500, help='how many bills to open')
+    parser.add_argument('--batch', type=int, default=1, help='introduce the bills this many at a time with !votebatch')
+    parser.add_argument('--reactions', type=int, default=10000, help='how many reactions to send')
+    parser.add_argument('--searches', type=int, default=100, help='how many !searchbills commands to run after the bills close')
+    parser.add_argument('--forecasts', type=int, default=10, help='how many !forecast commands to run while the bills are open')
+    parser.add_argument('--lookups', type=int, default=100, help='how many !record and !cohesion commands to run after the bills close')
+    parser.add_argument('--rate', type=float, default=0, help='reactions per minute (0 sends them as fast as possible)')
+    parser.add_argument('--senators', type=int, default=100)
+    parser.add_argument('--reps', type=int, default=435)
+    parser.add_argument('--outsiders', type=int, default=200, help='members without a chamber role')
+    parser.add_argument('--invalid', type=float, default=0.05, help='share of reactions from people who can\'t vote')
+    parser.add_argument('--latency', type=float, default=0, help='simulated latency of each API call in milliseconds')
+    parser.add_argument('--throttle', type=float, default=0, help='share of sends rejected with a 429')
+    parser.add_argument('--rate-limits', action='store_true', help='keep the bot\'s per-route rate limits (slow with many reactions)')
+    parser.add_argument('--raid', action='store_true', help='have every outsider pile reactions onto a message that isn\'t a bill and onto an open bill')
+    parser.add_argument('--watchdog', type=float, default=0, help='report what blocks the event loop for longer than this many milliseconds')
+    parser.add_argument('--show-record', action='store_true', help='print the first legislative record message and the last forecast')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # Use fake IDs and run in a temporary folder so nothing real is touched
+    for name, value in FAKE_ENV.items():
+        os.environ.setdefault(name, value)
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        import main as bot
+        asyncio.run(run(args, bot))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import math
+import re
+import time
+
+# Splits a command from its arguments
+COMMAND_SPLIT = re.compile(r'\s')
+
+
+# Raised by an argument parser when the arguments are invalid
+# The message is sent back to the user
+class ArgumentError(Exception):
+    pass
+
+
+# A single registered command
+class Command:
+    __slots__ = ('name', 'handler', 'parser', 'check', 'cooldown', 'lastUsed')
+
+    def __init__(self, name, handler, parser, check, cooldown):
+        self.name = name
+
+        # Coroutine function called with (message, command name, parsed arguments)
+        self.handler = handler
+
+        # Function that turns the argument text into the arguments passed to the handler
+        self.parser = parser
+
+        # Coroutine function called with the message that returns whether the user may run the command
+        self.check = check
+
+        # How many seconds each user has to wait between uses
+        self.cooldown = cooldown
+
+        # user ID -> when they last used it
+        self.lastUsed = {}
+
+
+# Keeps track of every command and sends each message to the right one
+class CommandRegistry:
+    def __init__(self, prefix, observer=None):
+        self.prefix = prefix
+
+        # Function called with (command name, seconds) after every command
+        self.observer = observer
+
+        # name -> command
+        self._commands = {}
+
+    # Decorator to register a command under one or more names
+    def command(self, *names, parser=None, check=None, cooldown=0):
+        def register(handler):
+            for name in names:
+                self._commands[name] = Command(name, handler, parser, check, cooldown)
+            return handler
+
+        return register
+
+    # Run the command in a message, if there is one
+    # Returns the command that was run (or None)
+    async def dispatch(self, message):
+        if not message.content.startswith(self.prefix):
+            return None
+
+        # Split it into 2 parts, the command and the argument(s)
+        parts = COMMAND_SPLIT.split(message.content, maxsplit=1)
+        name = parts[0][len(self.prefix):].lower()
+        text = parts[1] if len(parts) == 2 else ''
+
+        command = self._commands.get(name)
+        if command is None:
+            return None
+
+        # Make sure they're allowed to use it
+        if command.check is not None and not await command.check(message):
+            return command
+
+        # Make sure they're not using it too often
+        now = time.monotonic()
+        if command.cooldown > 0:
+            last = command.lastUsed.get(message.author.id)
+            if last is not None and now - last < command.cooldown:
+                await message.reply('Please wait {} more seconds before using this command again.'.format(math.ceil(command.cooldown - (now - last))))
+                return command
+
+        # Parse the arguments
+        try:
+            args = command.parser(text) if command.parser is not None else text
+        except ArgumentError as e:
+            await message.reply(str(e))
+            return command
+
+        if command.cooldown > 0:
+            command.lastUsed[message.author.id] = now
+
+        # Run it and time how long it takes
+        start = time.perf_counter()
+        try:
+            await command.handler(message, name, args)
+        finally:
+            if self.observer is not None:
+                self.observer(command.name, time.perf_counter() - start)
+
+        return command
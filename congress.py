@@ -0,0 +1,101 @@
+import csv
+import os
+import time
+
+# How often to check if the config file has changed, in seconds
+CHECK_INTERVAL = 5
+
+
+# Raised when the config file is missing or invalid
+class CongressConfigError(Exception):
+    pass
+
+
+# The number of seats each party has in each chamber, loaded from congress_config.csv
+# The first row lists the parties, the second row has the Senate seats and the third has the House seats
+# The first column is used for labels and is ignored
+class CongressConfig:
+    def __init__(self, path='congress_config.csv'):
+        self.path = path
+
+        # The party names in the order they appear in the file
+        self.parties = []
+
+        # chamber -> list of seats per party (same order as parties)
+        self._seats = {}
+
+        # Whether a valid config has been loaded yet
+        self._loaded = False
+
+        # The modification time of the file the last time it was checked
+        self._mtime = None
+        self._lastCheck = 0
+
+    # Parse and validate the file
+    def _parse(self):
+        try:
+            with open(self.path, 'r', newline='') as f:
+                lines = [row for row in csv.reader(f) if len(row) > 0]
+        except FileNotFoundError:
+            raise CongressConfigError(f'Error: please create {self.path}!')
+
+        if len(lines) < 3:
+            raise CongressConfigError(f'Error: {self.path} needs a party row, a Senate row and a House row')
+
+        parties = [party.strip() for party in lines[0][1:]]
+        if len(parties) == 0 or '' in parties or len(set(parties)) != len(parties):
+            raise CongressConfigError(f'Error: {self.path} must list each party exactly once')
+
+        seats = {}
+        for chamber, line in zip(['senate', 'house'], lines[1:3]):
+            if len(line) - 1 != len(parties):
+                raise CongressConfigError(f'Error: the {chamber} row in {self.path} must have a seat count for every party')
+
+            try:
+                counts = [int(value) for value in line[1:]]
+            except ValueError:
+                raise CongressConfigError(f'Error: the {chamber} row in {self.path} must only contain whole numbers')
+
+            if min(counts) < 0:
+                raise CongressConfigError(f'Error: the {chamber} row in {self.path} can\'t have negative seats')
+
+            seats[chamber] = counts
+
+        return parties, seats
+
+    # Reload the file if it has changed since it was last loaded
+    # Checks at most once every CHECK_INTERVAL seconds unless forced
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and self._loaded and now - self._lastCheck < CHECK_INTERVAL:
+            return
+        self._lastCheck = now
+
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if self._loaded and mtime == self._mtime:
+            return
+        self._mtime = mtime
+
+        try:
+            self.parties, self._seats = self._parse()
+            self._loaded = True
+        except CongressConfigError as e:
+            # Keep using the last good config if there is one
+            if not self._loaded:
+                raise
+            print(e)
+            print('Keeping the previous congress config')
+
+    # Get the number of seats per party in a chamber, in the same order as parties
+    def seatList(self, chamber):
+        self.refresh()
+        return self._seats[chamber]
+
+    # Get the number of seats per party in a chamber as {party: seats}
+    def seats(self, chamber):
+        seats = self.seatList(chamber)
+        return dict(zip(self.parties, seats))
@@ -0,0 +1,27 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Runs blocking file I/O on a single thread of its own, one call at a time in the order they were made
+# Everything that keeps a file uses one so reading and writing it never blocks the event loop
+class FileWorker:
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    # Run a function on the worker thread
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    # Stop the thread once everything already queued has run
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+# Open an SQLite database to be used from a file worker's thread
+# It's in WAL mode so a crash can never leave half a write behind
+def openDatabase(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
@@ -0,0 +1,119 @@
+import numpy as np
+from apportion import apportion
+
+# How many times each bill is simulated
+RUNS = 2000
+
+# Which percentiles of the margin (yes - no) to report
+PERCENTILES = [5, 50, 95]
+
+
+# The forecast for an open bill
+class Forecast:
+    __slots__ = ('passChance', 'tieChance', 'chambers')
+
+    def __init__(self, passChance, tieChance, chambers):
+        # The chance it passes every chamber it's voted on in
+        self.passChance = passChance
+
+        # The chance it only needs the Vice President to break a tie in the Senate
+        self.tieChance = tieChance
+
+        # chamber -> (chance it passes there, margin percentiles)
+        self.chambers = chambers
+
+
+# Simulate how the votes on a bill will end up in one chamber
+#
+# Each member who hasn't voted yet votes with the chance in turnout (their party's list), otherwise they're left
+# to become an NPC. The ones who vote split the same way their party has so far, drawn from a Dirichlet with one
+# extra vote for every option so a party with few votes can still surprise. Then the NPCs are allocated exactly as
+# they will be when the bill closes.
+#
+# votes has shape (parties, options) with the votes so far, turnout has a list of chances for each party and
+# seats has shape (parties,)
+# Returns an array of shape (runs, options) with the final totals in each run
+def simulateChamber(votes, turnout, seats, rng, runs=RUNS, present=1):
+    votes = np.asarray(votes, dtype=np.int64)
+    seats = np.asarray(seats, dtype=np.int64)
+    parties, options = votes.shape
+
+    final = np.repeat(votes[None], runs, axis=0)
+    for party in range(parties):
+        chances = np.asarray(turnout[party], dtype=np.float32)
+        if len(chances) == 0:
+            continue
+
+        # How many of the remaining members vote and how they split
+        voting = (rng.random((runs, len(chances)), dtype=np.float32) < chances).sum(axis=1)
+        split = rng.dirichlet(votes[party] + 1, size=runs)
+        final[:, party] += rng.multinomial(voting, split)
+
+    # Whoever still hasn't voted is an NPC
+    flat = final.reshape(runs * parties, options)
+    npcs = np.tile(seats, runs) - flat.sum(axis=1)
+    allocation = flat + apportion(flat, npcs, present)
+
+    # Parties no one voted in aren't counted when the bill closes
+    allocation[flat.sum(axis=1) == 0] = 0
+
+    return allocation.reshape(runs, parties, options).sum(axis=1)
+
+
+# Forecast a bill from the simulations of each chamber it's voted on in (all with the same number of runs)
+# chambers is chamber -> array of shape (runs, options)
+def summarize(chambers):
+    runs = len(next(iter(chambers.values())))
+    passed = np.ones(runs, dtype=bool)
+
+    # The Senate can be tied only if the House passed it (or wasn't asked)
+    senateTied = np.zeros(runs, dtype=bool)
+    houseMajority = np.ones(runs, dtype=bool)
+
+    results = {}
+    for chamber, totals in chambers.items():
+        margin = totals[:, 0] - totals[:, -1]
+        passed &= margin > 0
+
+        if chamber == 'senate':
+            senateTied = margin == 0
+        else:
+            houseMajority = margin > 0
+
+        results[chamber] = (float((margin > 0).mean()), np.percentile(margin, PERCENTILES).tolist())
+
+    return Forecast(float(passed.mean()), float((~passed & senateTied & houseMajority).mean()), results)
+
+
+# Forecast a bill
+# chambers is chamber -> (votes, turnout, seats) as taken by simulateChamber
+# The seed is derived from the key so the same votes always give the same forecast
+def forecastBill(chambers, key, runs=RUNS, present=1):
+    rng = np.random.default_rng(np.random.SeedSequence(key))
+    return summarize({chamber: simulateChamber(votes, turnout, seats, rng, runs, present) for chamber, (votes, turnout, seats) in chambers.items()})
+
+
+# Keeps the forecast for each open bill until the votes on it change
+class ForecastCache:
+    def __init__(self):
+        # bill key -> (version, forecast)
+        self._forecasts = {}
+
+    def __len__(self):
+        return len(self._forecasts)
+
+    # Get a bill's forecast (None if there isn't one for this version of the votes)
+    def get(self, key, version):
+        entry = self._forecasts.get(key)
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def put(self, key, version, forecast):
+        self._forecasts[key] = (version, forecast)
+
+    # Forget every bill that isn't in keys (the ones still open)
+    def prune(self, keys):
+        for key in list(self._forecasts):
+            if key not in keys:
+                del self._forecasts[key]
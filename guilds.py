@@ -0,0 +1,160 @@
+import json
+import os
+from registry import VoteRegistry
+from tally import TallyEngine
+from roles import RoleIndex
+from congress import CongressConfig
+from ratelimit import RouteLimiter
+from outbox import Outbox
+from moderation import ModerationQueue
+from scheduler import DeadlineScheduler
+from storage import openStorage
+from archive import BillArchive
+from votingrecord import VotingRecord
+from forecast import ForecastCache
+
+# The roles each sim needs (set by <name>_ROLE)
+ROLE_NAMES = ['ADMIN', 'MOD', 'SENATOR', 'REP', 'PRESIDENT', 'VP', 'DEM', 'PDU', 'NR', 'CON', 'IND']
+
+# The channels each sim needs
+CHANNEL_NAMES = ['SENATE_VOTING', 'HOUSE_VOTING', 'LEGISLATIVE_RECORD', 'ELECTION_RESULTS_CHANNEL']
+
+
+# Raised when a server's config is missing or invalid
+class GuildConfigError(Exception):
+    pass
+
+
+# The role and channel IDs and the files used by one sim
+class GuildConfig:
+    def __init__(self, guildID, ids, votesFile, congressFile, archiveFile, recordFile):
+        # The server's ID (None for the config from the environment, which is used for any server without its own)
+        self.guildID = guildID
+
+        # role name -> role ID
+        self.roles = {name: ids[f'{name}_ROLE'] for name in ROLE_NAMES}
+
+        self.senateVoting = ids['SENATE_VOTING']
+        self.houseVoting = ids['HOUSE_VOTING']
+        self.legislativeRecord = ids['LEGISLATIVE_RECORD']
+        self.electionResults = ids['ELECTION_RESULTS_CHANNEL']
+
+        # Where votes are saved, without the extension (.db or .json is added depending on the storage used)
+        self.votesFile = votesFile
+
+        # Where the seats in each chamber are loaded from
+        self.congressFile = congressFile
+
+        # Where closed bills are archived
+        self.archiveFile = archiveFile
+
+        # Where every member's vote on every closed bill is kept
+        self.recordFile = recordFile
+
+    # Read the IDs from a dict that uses the same names as the environment variables
+    @classmethod
+    def fromDict(cls, guildID, data, votesFile, congressFile, archiveFile, recordFile):
+        where = 'the environment' if guildID == None else f'server {guildID}'
+
+        ids = {}
+        for name in [f'{role}_ROLE' for role in ROLE_NAMES] + CHANNEL_NAMES:
+            if data.get(name) == None:
+                raise GuildConfigError(f'Error: {name} is missing from {where}!')
+
+            try:
+                ids[name] = int(data[name])
+            except (TypeError, ValueError):
+                raise GuildConfigError(f'Error: {name} in {where} must be an ID!')
+
+        return cls(guildID, ids, votesFile, congressFile, archiveFile, recordFile)
+
+    # Get the config from the environment variables (and .env file), using the original file names
+    @classmethod
+    def fromEnv(cls):
+        return cls.fromDict(None, os.environ, 'votes', 'congress_config.csv', 'archive.db', 'voting_record.bin')
+
+
+# Load the config for every sim
+# guilds.json maps each server ID to its IDs (named like the environment variables) and optionally "votes", "congress", "archive" and "record" file names
+# Without it, the environment variables are used for every server
+# Returns server ID (or None) -> config
+def loadGuildConfigs(path='guilds.json'):
+    if not os.path.exists(path):
+        return {None: GuildConfig.fromEnv()}
+
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise GuildConfigError(f'Error: {path} could not be read ({e})')
+
+    configs = {}
+    for key, entry in data.items():
+        try:
+            guildID = int(key)
+        except ValueError:
+            raise GuildConfigError(f'Error: {key} in {path} isn\'t a server ID!')
+
+        configs[guildID] = GuildConfig.fromDict(guildID, entry, entry.get('votes', f'votes-{guildID}'), entry.get('congress', f'congress_config-{guildID}.csv'), entry.get('archive', f'archive-{guildID}.db'), entry.get('record', f'voting_record-{guildID}.bin'))
+
+    return configs
+
+
+# Everything the bot keeps track of for one sim
+# Each sim has its own limiter, outbox and scheduler so closing a lot of bills in one doesn't hold up the others
+class Guild:
+    def __init__(self, config, options, parties, concurrency, getChannel, close, observer=None):
+        self.config = config
+
+        # Open votes and who has voted for what on them
+        self.votes = VoteRegistry()
+        self.tallies = TallyEngine(options)
+
+        # Who has each of the sim's roles
+        self.roleIndex = RoleIndex(config.roles)
+
+        # The number of seats each party has in each chamber
+        self.congress = CongressConfig(config.congressFile)
+
+        # Keeps API calls within Discord's rate limits
+        self.limiter = RouteLimiter(concurrency, observer=observer)
+
+        # Merges posts to the same channel into digests
+        self.outbox = Outbox(self.limiter, getChannel)
+
+        # Removes invalid reactions in the background
+        self.moderation = ModerationQueue(self.limiter)
+
+        # Runs close (a coroutine function called with this guild) as soon as the earliest vote ends
+        self.closer = DeadlineScheduler(self.votes.nextEndTime, lambda: close(self))
+
+        # Where votes are saved (opened by open())
+        self.storage = None
+
+        # Every closed bill, searchable by its text
+        self.archive = BillArchive(config.archiveFile)
+
+        # How every member has voted, with their attendance and how united each party is
+        self.record = VotingRecord(config.recordFile, parties, options)
+
+        # The latest forecast for each open bill, kept until the votes on it change
+        self.forecasts = ForecastCache()
+
+    # Open the storage, load the votes that were open when the bot last stopped and load the voting record
+    async def open(self, kind):
+        self.storage = await openStorage(kind, f'{self.config.votesFile}.json', f'{self.config.votesFile}.db')
+        for vote in await self.storage.load():
+            self.votes.add(vote)
+        await self.record.load()
+
+    # Get the chamber a voting channel belongs to (None if it isn't a voting channel)
+    def chamber(self, channelID):
+        if channelID == self.config.senateVoting:
+            return 'senate'
+        elif channelID == self.config.houseVoting:
+            return 'house'
+        return None
+
+    # Get the voting channel of a chamber
+    def channelID(self, chamber):
+        return self.config.senateVoting if chamber == 'senate' else self.config.houseVoting
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+
+# How often the event loop checks in with the watchdog, in seconds
+INTERVAL = 0.1
+
+# How many frames of a blocking stack are kept
+STACK_DEPTH = 12
+
+# How many of the innermost functions are used to describe where a stall happened
+DESCRIBE_DEPTH = 3
+
+# Frames from here are the event loop itself rather than what it's running
+ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+
+
+# Measures how late the event loop is running and finds out what's blocking it
+# A coroutine checks in every INTERVAL seconds. A thread watches for it to be late, and if it's later than the threshold
+# it captures the stack of whatever the loop is stuck running. Stalls are added up by where they happened.
+class LoopWatchdog:
+    def __init__(self, threshold, interval=INTERVAL, observer=None):
+        # How late the loop has to be before its stack is captured, in seconds
+        self.threshold = threshold
+        self.interval = interval
+
+        # Function called with how late the loop was (in seconds) each time it checks in
+        self.observer = observer
+
+        # stack -> [stalls, total seconds, longest seconds]
+        self._offenders = {}
+        self._lock = threading.Lock()
+
+        # When the loop last checked in
+        self._beat = None
+
+        self._loopThread = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    # Start watching the running event loop (does nothing if it's already being watched)
+    def start(self):
+        if self._task is not None and not self._task.done():
+            return
+
+        self._loopThread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._checkIn())
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+
+    # Stop watching
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._stop.set()
+
+    # Runs on the event loop
+    async def _checkIn(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+
+            self._beat = time.monotonic()
+            if self.observer is not None:
+                self.observer(max(self._beat - expected, 0))
+
+    # Runs on the watchdog's own thread so it can look at the loop while it's stuck
+    def _watch(self):
+        # (check in time, stack) for the stall currently being watched
+        stall = None
+
+        while not self._stop.wait(min(self.threshold, self.interval) / 2):
+            beat = self._beat
+
+            # The loop has checked in again, so the stall is over and its full length is known
+            if stall is not None and stall[0] != beat:
+                self._record(stall[1], beat - stall[0] - self.interval)
+                stall = None
+
+            if stall is None and time.monotonic() - beat - self.interval >= self.threshold:
+                frame = sys._current_frames().get(self._loopThread)
+                if frame is None:
+                    continue
+
+                stack = captureStack(frame)
+                del frame
+
+                stall = (beat, stack)
+                print('Event loop blocked for over {:.0f}ms in {}\n{}'.format(self.threshold * 1000, describe(stack), formatStack(stack)))
+
+    def _record(self, stack, seconds):
+        with self._lock:
+            data = self._offenders.setdefault(stack, [0, 0, 0])
+            data[0] += 1
+            data[1] += seconds
+            data[2] = max(data[2], seconds)
+
+    # Get (where, stalls, total seconds, longest seconds) for the places that blocked the loop the longest
+    def offenders(self, limit=5):
+        with self._lock:
+            rows = [(describe(stack), count, total, longest) for stack, (count, total, longest) in self._offenders.items()]
+
+        # Stacks captured at different lines of the same functions are counted together
+        merged = {}
+        for where, count, total, longest in rows:
+            data = merged.setdefault(where, [0, 0, 0])
+            data[0] += count
+            data[1] += total
+            data[2] = max(data[2], longest)
+
+        return sorted(((where, *data) for where, data in merged.items()), key=lambda row: -row[2])[:limit]
+
+
+# Get the stack of what the event loop is running, leaving out the loop itself
+def captureStack(frame):
+    entries = traceback.extract_stack(frame)
+
+    # Start after the loop's last frame (the callback or task it's running)
+    # If the loop itself is what's busy, keep its frames
+    start = 0
+    for i, entry in enumerate(entries):
+        if entry.filename.startswith(ASYNCIO_DIR) and i + 1 < len(entries):
+            start = i + 1
+
+    return tuple((os.path.basename(entry.filename), entry.lineno, entry.name) for entry in entries[start:][-STACK_DEPTH:])
+
+
+# Describe where a stack is by its innermost functions (like "closeVotes → getVotes → billTotals")
+def describe(stack):
+    return ' → '.join(name for _, _, name in stack[-DESCRIBE_DEPTH:])
+
+
+# Format a captured stack for printing
+def formatStack(stack):
+    return '\n'.join(f'  {filename}:{lineno} in {name}' for filename, lineno, name in stack)
@@ -1,15 +1,29 @@
 import os
+import asyncio
 import discord
-from discord.ext import tasks
 import json
 import re
 import math
-import csv
 import random
+import time
 from datetime import datetime, timedelta
-from discord import Intents, Client, Message
+from typing import Literal
+from discord import Intents, AutoShardedClient, Message, MemberCacheFlags
 from discord import app_commands
 from dotenv import load_dotenv
+from registry import VoteRecord
+from congress import CongressConfigError
+from apportion import billTotals
+from partisanship import BasePartisanship, PartisanshipError, writeCSV
+from simulation import simulate, resultsTable
+from activity import ActivityIndex
+from commands import CommandRegistry, ArgumentError
+from metrics import Metrics, timed, formatTable
+from guilds import Guild, loadGuildConfigs
+from loopwatch import LoopWatchdog
+from moderation import HIGH, NORMAL, LOW
+from archive import ArchivedBill
+from forecast import forecastBill
 
 # What character to use for commands (must be only 1 character)
 prefix = '!'
@@ -23,6 +37,21 @@ SUM_LEN = 150
 # How many hours the vote should last for
 VOTE_LEN = 24
 
+# The most elections !simulate can run at once
+MAX_SIMULATIONS = 20000
+
+# How many members to show on each page of !countmessages
+COUNT_PAGE_SIZE = 20
+
+# How many new messages !countmessages counts between saving its progress
+COUNT_SAVE_EVERY = 5000
+
+# The most bills !votebatch can introduce at once
+MAX_BATCH_BILLS = 25
+
+# How many API calls can be made at once when closing votes
+CLOSE_CONCURRENCY = 8
+
 # Used as a divider in messages
 DIVIDER = '-' * 40
 
@@ -31,52 +60,125 @@ load_dotenv()
 
 TOKEN = os.getenv('DISCORD_TOKEN')
 
-ADMIN_ROLE = int(os.getenv('ADMIN_ROLE'))
-MOD_ROLE = int(os.getenv('MOD_ROLE'))
-SENATOR_ROLE = int(os.getenv('SENATOR_ROLE'))
-REP_ROLE = int(os.getenv('REP_ROLE'))
-PRESIDENT_ROLE = int(os.getenv('PRESIDENT_ROLE'))
-VP_ROLE = int(os.getenv('VP_ROLE'))
+# The party roles in the order they're checked
+PARTIES = ['DEM', 'PDU', 'NR', 'CON', 'IND']
+
+# The role and channel IDs for each server the bot runs a sim in
+# If this file doesn't exist, the IDs are read from the environment (ADMIN_ROLE, SENATE_VOTING, etc.) and used for every server
+GUILD_CONFIG = os.getenv('GUILD_CONFIG', 'guilds.json')
+
+# How many shards to connect with (Discord's recommendation is used if not set)
+SHARD_COUNT = os.getenv('SHARD_COUNT')
 
-NR_ROLE = int(os.getenv('NR_ROLE'))
-DEM_ROLE = int(os.getenv('DEM_ROLE'))
-CON_ROLE = int(os.getenv('CON_ROLE'))
-PDU_ROLE = int(os.getenv('PDU_ROLE'))
-IND_ROLE = int(os.getenv('IND_ROLE'))
+# Whether to read commands like !vote from messages (set to off to only use slash commands, which don't need the message content intent)
+PREFIX_COMMANDS = os.getenv('PREFIX_COMMANDS', 'on') != 'off'
 
-SENATE_VOTING = int(os.getenv('SENATE_VOTING'))
-HOUSE_VOTING = int(os.getenv('HOUSE_VOTING'))
-LEGISLATIVE_RECORD = int(os.getenv('LEGISLATIVE_RECORD'))
-ELECTION_RESULTS_CHANNEL = int(os.getenv('ELECTION_RESULTS_CHANNEL'))
+# Where to keep votes ('sqlite' or 'json')
+VOTE_STORAGE = os.getenv('VOTE_STORAGE', 'sqlite')
+
+# Port to serve Prometheus metrics on at http://127.0.0.1:<port>/metrics (off if not set)
+METRICS_PORT = os.getenv('METRICS_PORT')
+
+# How many milliseconds the event loop can be blocked for before the watchdog captures what's blocking it (off if not set)
+LOOP_WATCHDOG_MS = os.getenv('LOOP_WATCHDOG_MS')
+
+# Whether to skip discord.py's member cache and only keep the name and roles of members with one of the sim's roles (off if not set)
+# Saves a lot of memory in large servers, since everyone else isn't kept at all
+SLIM_MEMBER_CACHE = os.getenv('SLIM_MEMBER_CACHE', 'off') == 'on'
 
 # Bot setup
 intents = Intents.default()
-intents.message_content = True
+intents.message_content = PREFIX_COMMANDS
 intents.members = True
-client = Client(intents=intents)
+
+if SLIM_MEMBER_CACHE:
+    # Members are fetched once in on_ready without being cached, and role changes are read from the raw gateway events
+    # (discord.py ignores updates to members it hasn't cached)
+    client = AutoShardedClient(intents=intents, shard_count=int(SHARD_COUNT) if SHARD_COUNT != None else None, member_cache_flags=MemberCacheFlags.none(), chunk_guilds_at_startup=False, enable_debug_events=True)
+else:
+    client = AutoShardedClient(intents=intents, shard_count=int(SHARD_COUNT) if SHARD_COUNT != None else None)
 tree = app_commands.CommandTree(client)
 
 # Is the command tree currently synced?
 synced = False
 
-# Keeps track of votes
-votes = {
-    'votes': []
-}
-
-# Load votes from json file
-if os.path.isfile('votes.json'):
-    votes = json.load(open('votes.json', 'r'))
-
+# Keeps track of how the bot is performing
+metrics = Metrics('polsim')
+handlerSeconds = metrics.histogram('handler_seconds', 'Time spent in each event handler')
+handlerErrors = metrics.counter('handler_errors_total', 'Errors raised by each event handler')
+commandSeconds = metrics.histogram('command_seconds', 'Time spent running each command')
+apiSeconds = metrics.histogram('api_seconds', 'Time spent on each kind of Discord API call')
+apiCalls = metrics.counter('api_calls_total', 'Discord API calls made of each kind')
+apiErrors = metrics.counter('api_errors_total', 'Discord API calls of each kind that failed')
+closeSeconds = metrics.histogram('close_pass_seconds', 'Time spent on each pass closing expired votes')
+billsClosed = metrics.counter('bills_closed_total', 'Bills that have been closed')
+loopLag = metrics.histogram('loop_lag_seconds', 'How late the event loop was each time the watchdog checked')
+
+# Finds out what's blocking the event loop (started in setup_hook if enabled)
+watchdog = LoopWatchdog(int(LOOP_WATCHDOG_MS) / 1000, observer=loopLag.observe) if LOOP_WATCHDOG_MS != None else None
+
+# Record an API call made through the rate limiter
+def observeApiCall(route, seconds, failed):
+    apiCalls.inc(route=route)
+    apiSeconds.observe(seconds, route=route)
+    if failed:
+        apiErrors.inc(route=route)
+
+# The state of each sim, by server ID (None for the one from the environment)
+guilds = {guildID: Guild(config, len(VOTE_EMOJIS), PARTIES, CLOSE_CONCURRENCY, lambda channelID: client.get_channel(channelID), lambda guild: closeVotes(guild), observeApiCall) for guildID, config in loadGuildConfigs(GUILD_CONFIG).items()}
+
+# Get the sim for a server (None if the bot isn't set up there)
+def guildFor(guildID):
+    return guilds.get(guildID, guilds.get(None))
+
+# Get the sim a message was sent in (None if the bot isn't set up there)
+def guildOf(message):
+    return guildFor(message.guild.id if message.guild != None else None)
+
+metrics.gauge('open_votes', 'Votes that are currently open', lambda: sum(len(guild.votes) for guild in guilds.values()))
+metrics.gauge('moderation_queue', 'Reaction removals waiting to be made', lambda: sum(len(guild.moderation) for guild in guilds.values()))
+
+# The base partisanship of each state
+basePartisanship = BasePartisanship('base_partisanship.csv')
+
+# How many messages each member has sent in each channel
+activity = ActivityIndex('activity.json')
+
+# Get the role needed to vote in a chamber
+def chamberRole(chamber):
+    return 'SENATOR' if chamber == 'senate' else 'REP'
+
+# Get a member's display name (None if they can't be found)
+# Members with one of the sim's roles are always found, even without the member cache
+def displayName(guild, server, memberID):
+    name = guild.roleIndex.name(memberID)
+    if name != None:
+        return name
+
+    # There's no server to look them up in if the command came from a DM
+    if server == None:
+        return None
+
+    member = server.get_member(memberID)
+    return member.display_name if member != None else None
+
+# Check if a member is allowed to vote in a chamber
+def canVote(guild, member, chamber):
+    return guild.roleIndex.has(member.id, chamberRole(chamber))
+
+# Get a member's party (defaults to IND if they don't have a party role)
+def getParty(guild, member):
+    return partyOf(guild, member.id)
+
+# Get a member's party from their ID
+def partyOf(guild, memberID):
+    party = guild.roleIndex.first(memberID, PARTIES)
+    return party if party != None else 'IND'
 
 # Verify if a user has permission to use a restricted command
 async def verifyPermission(message):
     # Check if they have an admin or mod role
-    roleFound = False
-    for role in message.author.roles:
-        if role.id == ADMIN_ROLE or role.id == MOD_ROLE:
-            roleFound = True
-            break
+    roleFound = guildOf(message).roleIndex.has(message.author.id, 'ADMIN', 'MOD')
 
     # Tell the user permission was denied
     if not roleFound:
@@ -85,251 +187,517 @@ async def verifyPermission(message):
     # Return boolean
     return roleFound
 
+# Every command the bot responds to
+commandRegistry = CommandRegistry(prefix, observer=lambda name, seconds: commandSeconds.observe(seconds, command=name))
+
+# Cut a reply down to fit in a message, ending it with suffix if anything was cut
+def truncate(reply, suffix='...', limit=1900):
+    if len(reply) > limit:
+        return reply[:limit] + suffix
+    return reply
+
+# Split a command's arguments on whitespace
+def splitArgs(text):
+    return text.split()
+
+# Matches anything that can't be the start of a number
+NOT_A_NUMBER = re.compile(r'[^0-9.]')
+
+# Parse the percentage chance given to !chance
+def parseChance(text):
+    # Make sure there's a percentage chance
+    if len(text) == 0:
+        raise ArgumentError('Please provide a percentage chance. Example: `!chance 50`')
+
+    # Make sure it's a number
+    if NOT_A_NUMBER.match(text):
+        raise ArgumentError('The chance must be a number.')
+
+    try:
+        # Get the chance as a float
+        chance = float(text) / 100
+    except ValueError:
+        raise ArgumentError('Chance argument is invalid.')
+
+    # Make sure it's within the acceptable range
+    if chance > 1:
+        raise ArgumentError('Maximum chance allowed is 100%.')
+    elif chance < 0:
+        raise ArgumentError('Minimum chance allowed is 0%.')
+
+    return chance
+
 @client.event
+@timed(handlerSeconds, handlerErrors, handler='on_message')
 async def on_message(message):
     # Ignore the bot's own messages as well as empty messages
     if message.author == client.user or len(message.content) == 0:
         return
 
+    # Ignore servers the bot isn't set up in
+    if guildOf(message) == None:
+        return
+
     # Check if it's a command
     if message.content[0] == prefix:
-        # Split it into 2 parts, the command and the argument(s)
-        parts = re.split(r'[\b \b]', message.content, maxsplit=1)
-        cmd = parts[0][1:].lower()
+        await commandRegistry.dispatch(message)
+
+# The kind of vote each voting command starts
+VOTE_TYPES = {
+    'vote': 'both',
+    'votesenate': 'senate',
+    'votehouse': 'house',
+    'votebatch': 'both',
+    'votebatchsenate': 'senate',
+    'votebatchhouse': 'house'
+}
 
-        if cmd == 'countmessages':
-            if not await verifyPermission(message):
-                return
+# Get the chambers a kind of vote is held in
+def voteChambers(voteType):
+    return ['senate', 'house'] if voteType == 'both' else [voteType]
+
+# Get a summary of a bill to save
+def summarize(text):
+    summary = text.strip()
+    if len(summary) > SUM_LEN:
+        words = summary.split(' ')
+        summary = ''
+        chars = 0
+        for word in words:
+            summary += f' {word}'
+            if len(summary) + 1 >= SUM_LEN:
+                break
+        if chars < len(text) - 6:
+            summary += '...'
+    return summary.strip()
 
-            # Dictionary to keep track of the message count
-            messageCount = {}
+# Add the voting emojis to a message (in order, so they always show up the same way)
+async def addVoteReactions(guild, cid, botMessage):
+    for emoji in VOTE_EMOJIS:
+        await guild.limiter.call('reaction', cid, botMessage.add_reaction, emoji)
 
-            # Get a list of every message in that channel
-            async for msg in message.channel.history(limit=999):
-                # Ignore the bot's own messages and any message that begins with the command prefix
-                if msg.author == client.user or len(msg.content) == 0 or msg.content.startswith(prefix):
-                    continue
+# Post bills to a chamber's voting channel in order
+# The emojis are added to each message as soon as it's posted, while the next one is being sent
+# Returns the IDs of the messages and the tasks adding the emojis
+# sent is called with (chamber, bill number, message ID) as soon as each message is sent
+async def postToChamber(guild, chamber, bills, sponsor, timestamp, sent):
+    cid = guild.channelID(chamber)
 
-                if msg.author is discord.Member:
-                    key = '{} - {}'.format(msg.author.nick, msg.author.name)
-                else:
-                    key = '{} - {}'.format(msg.author.display_name, msg.author.name)
-
-                if key in messageCount.keys():
-                    # Increment the count
-                    messageCount[key] += 1
-                else:
-                    # Create a new entry with a value of one
-                    messageCount[key] = 1
-
-            # Build the message to reply with
-            reply = ''
-            for name in messageCount.keys():
-                reply = f'{reply}\n{name}: {messageCount[name]}'
-
-            # Send the reply
-            await message.reply(f'```{reply}```')
-        elif cmd == 'vote' or cmd == 'votesenate' or cmd == 'votehouse':
-            # Check if it's in the correct channel
-            if (cmd == 'vote' and message.channel.id in [SENATE_VOTING, HOUSE_VOTING]) or (cmd == 'votesenate' and message.channel.id == SENATE_VOTING) or (cmd == 'votehouse' and message.channel.id == HOUSE_VOTING):
-                # Make sure there's actually a message
-                if len(parts) >= 2:
-                    # Get the end time
-                    endTime = datetime.now() + timedelta(hours=VOTE_LEN)
-                    timestamp = str(round(endTime.timestamp()))
-
-                    # Send the voting messages
-                    messageIDs = {'senate': None, 'house': None}
-                    for cid in [SENATE_VOTING, HOUSE_VOTING]:
-                        # Skip the house if it's senate-only and skip the senate if it's house-only
-                        if (cmd == 'votesenate' and cid != SENATE_VOTING) or (cmd == 'votehouse' and cid != HOUSE_VOTING):
-                            continue
-
-                        # Get the role to mention
-                        role = SENATOR_ROLE if cid == SENATE_VOTING else REP_ROLE
-                        #role = ''
-
-                        # Get the final line of the message
-                        finalLine = 'Sponsored by {} | Vote ends <t:{}:R> | <@&{}>'.format(message.author.name, timestamp, role)
-
-                        # Get the channel
-                        channel = client.get_channel(cid)
-
-                        # Send the message
-                        botMessage = await channel.send('{}\n{}\n{}'.format(parts[1].strip(), DIVIDER, finalLine))
-
-                        # Save the ID
-                        messageIDs['senate' if cid == SENATE_VOTING else 'house'] = botMessage.id
-
-                        # Add emojis
-                        for emoji in VOTE_EMOJIS:
-                            await botMessage.add_reaction(emoji)
-
-                    # Get a summary of the bill to save
-                    match = re.search(r"[ \n]", message.content)
-                    summary = ''
-                    if match:
-                        summary = message.content[match.start() + 1:]
-                    else:
-                        match = message.content
-                    if len(summary) > SUM_LEN:
-                        words = summary.split(' ')
-                        summary = ''
-                        chars = 0
-                        for word in words:
-                            summary += f' {word}'
-                            if len(summary) + 1 >= SUM_LEN:
-                                break
-                        if chars < len(message.content) - 6:
-                            summary += '...'
-                    summary = summary.strip()
-
-                    # Save the vote to the dictionary
-                    votes['votes'].append({
-                        'type': 'both' if cmd == 'vote' else 'senate' if cmd == 'votesenate' else 'house',
-                        'message_ids': messageIDs,
-                        'summary': summary,
-                        'end_time': timestamp
-                    })
-
-                    # Delete the command message
-                    await message.delete()
-
-                    # Save the votes json file (we wait until the end to save it for performance reasons)
-                    with open('votes.json', 'w') as f:
-                        json.dump(votes, f)
-                else:
-                    # Tell the user to specify a message
-                    await message.reply('Please specify something to vote on.')
-            else:
-                # It's not in the correct channel
-                await message.reply('Incorrect channel.')
-        elif cmd == 'chance':
-            # Make sure there's a percentage chance
-            if len(parts) == 2:
-                # Make sure it's a number
-                if re.match(r'[^0-9.]', parts[1]):
-                    # Tell the user to specify a number
-                    await message.reply('The chance must be a number.')
-                else:
-                    try:
-                        # Get the chance as a float
-                        chance = float(parts[1]) / 100
-
-                        # Make sure it's within the acceptable range
-                        if chance > 1:
-                            await message.reply('Maximum chance allowed is 100%.')
-                        elif chance < 0:
-                            await message.reply('Minimum chance allowed is 0%.')
-                        else:
-                            # Run the random chance
-                            success = random.random() < chance
-
-                            # Tell the user
-                            await message.reply(str(success))
-                    except ValueError:
-                        await message.reply('Chance argument is invalid.')
-            elif len(parts) > 2:
-                # Tell the user too many arguments were passed
-                await message.reply('This command only takes one argument.')
+    # Get the role to mention
+    role = guild.config.roles[chamberRole(chamber)]
+
+    # Get the final line of the message
+    finalLine = 'Sponsored by {} | Vote ends <t:{}:R> | <@&{}>'.format(sponsor, timestamp, role)
+
+    # Get the channel
+    channel = client.get_channel(cid)
+
+    seeding = []
+    for i, text in enumerate(bills):
+        # Send the message
+        botMessage = await guild.limiter.call('send', cid, channel.send, '{}\n{}\n{}'.format(text.strip(), DIVIDER, finalLine))
+        sent(chamber, i, botMessage.id)
+
+        # Add emojis
+        seeding.append(asyncio.create_task(addVoteReactions(guild, cid, botMessage)))
+
+    return seeding
+
+# Start votes on one or more bills
+# Both chambers are posted to at the same time and every new vote is saved in one write
+async def introduceBills(guild, sponsor, voteType, bills):
+    # Get the end time
+    endTime = datetime.now() + timedelta(hours=VOTE_LEN)
+    timestamp = str(round(endTime.timestamp()))
+
+    chambers = voteChambers(voteType)
+    messageIDs = [{'senate': None, 'house': None} for _ in bills]
+    waiting = [len(chambers)] * len(bills)
+    records = [None] * len(bills)
+
+    # Add each vote to the registry as soon as it's been posted in every chamber, so votes on it count straight away
+    # rather than after the rest of the batch has been sent
+    def sent(chamber, i, messageID):
+        messageIDs[i][chamber] = messageID
+        waiting[i] -= 1
+        if waiting[i] == 0:
+            records[i] = VoteRecord(voteType, messageIDs[i], summarize(bills[i]), timestamp)
+            guild.votes.add(records[i])
+
+            # Let the scheduler know there's a new deadline
+            guild.closer.rearm()
+
+    # Send the voting messages
+    seeding = []
+    try:
+        for tasks in await asyncio.gather(*(postToChamber(guild, chamber, bills, sponsor, timestamp, sent) for chamber in chambers)):
+            seeding.extend(tasks)
+    finally:
+        # Save every vote that was started in one write (even if sending the rest failed) and wait for the emojis to be added
+        await asyncio.gather(guild.storage.insert(*[vote for vote in records if vote != None]), *seeding)
+
+# Check if a kind of vote can be started in a channel
+def inVotingChannel(guild, voteType, channelID):
+    return guild.chamber(channelID) in voteChambers(voteType)
+
+# Start votes from a command message, deleting the message at the same time
+async def introduceFromMessage(guild, message, voteType, bills):
+    await asyncio.gather(introduceBills(guild, message.author.name, voteType, bills), guild.limiter.call('delete', message.channel.id, message.delete))
+
+@commandRegistry.command('vote', 'votesenate', 'votehouse')
+async def startVote(message, cmd, args):
+    guild = guildOf(message)
+
+    # Check if it's in the correct channel
+    if inVotingChannel(guild, VOTE_TYPES[cmd], message.channel.id):
+        # Make sure there's actually a message
+        if len(args.strip()) > 0:
+            await introduceFromMessage(guild, message, VOTE_TYPES[cmd], [args])
+        else:
+            # Tell the user to specify a message
+            await message.reply('Please specify something to vote on.')
+    else:
+        # It's not in the correct channel
+        await message.reply('Incorrect channel.')
+
+# Matches the line separating bills in !votebatch
+BATCH_DELIMITER = re.compile(r'^\s*-{3,}\s*$', re.MULTILINE)
+
+# Split the bills given to !votebatch
+def splitBills(text):
+    bills = [bill.strip() for bill in BATCH_DELIMITER.split(text) if len(bill.strip()) > 0]
+
+    # Make sure there's at least one bill
+    if len(bills) == 0:
+        raise ArgumentError('Please specify something to vote on. Put each bill on its own lines with a line of `---` between them.')
+
+    # Make sure there aren't too many
+    if len(bills) > MAX_BATCH_BILLS:
+        raise ArgumentError(f'At most {MAX_BATCH_BILLS} bills can be introduced at once.')
+
+    return bills
+
+@commandRegistry.command('votebatch', 'votebatchsenate', 'votebatchhouse', parser=splitBills)
+async def startVoteBatch(message, cmd, bills):
+    guild = guildOf(message)
+
+    # Check if it's in the correct channel
+    if inVotingChannel(guild, VOTE_TYPES[cmd], message.channel.id):
+        await introduceFromMessage(guild, message, VOTE_TYPES[cmd], bills)
+    else:
+        # It's not in the correct channel
+        await message.reply('Incorrect channel.')
+
+@commandRegistry.command('chance', parser=parseChance)
+async def chanceCommand(message, cmd, chance):
+    # Run the random chance
+    success = random.random() < chance
+
+    # Tell the user
+    await message.reply(str(success))
+
+@commandRegistry.command('getbp', check=verifyPermission, cooldown=5)
+async def getBPCommand(message, cmd, args):
+    bp = getBP()
+    if bp != None:
+        await message.reply(file=bp)
+
+# Count how many messages each member has sent in a channel
+# Only messages sent since the last count are fetched, everything before that comes from the activity index
+@commandRegistry.command('countmessages', parser=splitArgs, check=verifyPermission, cooldown=10)
+async def countMessages(message, cmd, args):
+    # Get the page and how to sort it
+    page = 1
+    sort = 'count'
+    for arg in args:
+        if arg.isdigit() and int(arg) > 0:
+            page = int(arg)
+        elif arg.lower() in ['count', 'name']:
+            sort = arg.lower()
+        else:
+            await message.reply('Usage: `!countmessages [page] [count|name]`')
+            return
+
+    # Count any new messages
+    async with message.channel.typing():
+        await countActivity(message.channel)
+
+    # Send the reply
+    await message.reply(countPage(message.channel.id, page, sort))
+
+# Count the messages sent in a channel since it was last counted
+async def countActivity(channel):
+    async with activity.lock(channel.id):
+        # Start from the last message that was counted (or the start of the channel)
+        last = activity.checkpoint(channel.id)
+        after = discord.Object(last) if last != None else None
+        counted = 0
+
+        async for msg in channel.history(limit=None, after=after, oldest_first=True):
+            activity.seen(channel.id, msg.id)
+
+            # Ignore the bot's own messages
+            if msg.author == client.user:
+                continue
+
+            # Ignore empty messages and any message that begins with the command prefix
+            # Without the message content intent Discord leaves out the text of everyone else's messages, so they're all counted
+            if PREFIX_COMMANDS and (len(msg.content) == 0 or msg.content.startswith(prefix)):
+                continue
+
+            if isinstance(msg.author, discord.Member) and msg.author.nick != None:
+                key = '{} - {}'.format(msg.author.nick, msg.author.name)
             else:
-                # Tell the user to provide a percentage chance
-                await message.reply('Please provide a percentage chance. Example: `!chance 50`')
-        elif cmd == 'getbp':
-            if not await verifyPermission(message):
-                return
-            await getBP(message)
+                key = '{} - {}'.format(msg.author.display_name, msg.author.name)
+
+            activity.record(channel.id, msg.id, msg.author.id, key)
+
+            # Save the progress every so often so a huge channel doesn't have to start over
+            counted += 1
+            if counted % COUNT_SAVE_EVERY == 0:
+                await activity.save()
+
+        await activity.save()
+
+# Get a page of the message counts in a channel
+def countPage(channelID, page, sort):
+    # Get the page to show
+    rows = activity.counts(channelID, sort)
+    pages = max(math.ceil(len(rows) / COUNT_PAGE_SIZE), 1)
+    page = min(page, pages)
+    rows = rows[(page - 1) * COUNT_PAGE_SIZE:page * COUNT_PAGE_SIZE]
+
+    # Build the message to reply with
+    reply = '\n'.join('{}: {}'.format(name, count) for name, count in rows)
+
+    return f'```\n{reply}\n```Page {page}/{pages}'
+
+# Reply with every member of a chamber who hasn't voted on a bill yet
+@commandRegistry.command('notvoted', parser=str.strip)
+async def notVoted(message, cmd, arg):
+    guild = guildOf(message)
+
+    # Check if it's in a voting channel
+    chamber = guild.chamber(message.channel.id)
+    if chamber == None:
+        await message.reply('Incorrect channel.')
+        return
+
+    # Find the bill
+    if not arg.isdigit():
+        await message.reply('Please provide the message ID of the bill. Example: `!notvoted 123456789`')
+        return
+
+    if guild.votes.get(chamber, int(arg)) == None:
+        await message.reply('That isn\'t an open bill.')
+        return
+
+    # Everyone in the chamber who isn't in the tally
+    voters = guild.tallies.voters(chamber, int(arg))
+    missing = [memberID for memberID in guild.roleIndex.members(chamberRole(chamber)) if memberID not in voters]
+
+    names = []
+    for memberID in missing:
+        name = displayName(guild, message.guild, memberID)
+        if name != None:
+            names.append(name)
+
+    if len(names) == 0:
+        await message.reply('Everyone has voted.')
+        return
+
+    reply = truncate(', '.join(sorted(names, key=str.lower)))
+
+    await message.reply(f'{len(names)} still to vote: {reply}')
 
 @client.event
+@timed(handlerSeconds, handlerErrors, handler='on_reaction_add')
 async def on_reaction_add(reaction, user):
     # Ignore the bot's own reactions
     if user == client.user:
         return
 
+    # Ignore servers the bot isn't set up in
+    guild = guildOf(reaction.message)
+    if guild == None:
+        return
+
     # Get which channel it's in
     channel = reaction.message.channel.id
 
     # Check if the reaction is in a voting channel
-    if channel in [SENATE_VOTING, HOUSE_VOTING]:
-        # Get the chamber
-        chamber = 'senate' if channel == SENATE_VOTING else 'house'
+    chamber = guild.chamber(channel)
+    if chamber != None:
+        # Removals are queued so a flood of invalid reactions doesn't hold up the handler
 
-        # Remove invalid emojis
+        # Remove invalid emojis (all of them at once, since none of them count)
         if not reaction.emoji in VOTE_EMOJIS:
-            await reaction.clear()
+            guild.moderation.clear(reaction.message, reaction.emoji, priority=LOW)
+            return
 
         # Remove reaction if the message isn't a bill or voting has ended
         # This is the easiest way to do it without keeping track of every bill forever
-        voteFound = None
-        for vote in votes['votes']:
-            if chamber in vote['message_ids']:
-                if vote['message_ids'][chamber] == reaction.message.id:
-                    voteFound = vote
-                    break
+        voteFound = guild.votes.get(chamber, reaction.message.id)
 
         # Remove reaction if no vote was found
+        # If someone else posted the message it isn't a bill, so every reaction with the emoji can be cleared at once
+        # (the bot's own messages may be bills it hasn't registered or added its emojis to yet, so those are removed one by one)
         if voteFound == None:
-            await reaction.remove(user)
+            guild.moderation.remove(reaction.message, reaction.emoji, user, priority=LOW, clearable=reaction.message.author != client.user)
             return
 
-        # Check if the time has expired yet
-        endTime = datetime.fromtimestamp(int(voteFound['end_time']))
-
         # Remove reaction if the vote has ended
-        if endTime <= datetime.now():
-            await reaction.remove(user)
+        if voteFound.endTime <= time.time():
+            guild.moderation.remove(reaction.message, reaction.emoji, user, priority=LOW)
             return
 
         # Remove reactions from people with the wrong role
-        valid = False
-        for role in user.roles:
-            if (role.id == SENATOR_ROLE and channel == SENATE_VOTING) or (role.id == REP_ROLE and channel == HOUSE_VOTING):
-                valid = True
-                break
-
-        if not valid:
-            await reaction.remove(user)
+        if not canVote(guild, user, chamber):
+            guild.moderation.remove(reaction.message, reaction.emoji, user, priority=NORMAL)
             return
 
-        # Only allow 1 reaction
-        for r in reaction.message.reactions:
-            # Ignore the reaction that was just added
-            if r.emoji == reaction.emoji:
-                continue
+@client.event
+async def on_member_join(member):
+    guild = guildFor(member.guild.id)
+    if guild != None:
+        guild.roleIndex.update(member)
+
+@client.event
+async def on_member_update(before, after):
+    # Keep the role index up to date when someone's roles change
+    guild = guildFor(after.guild.id)
+    if guild != None:
+        guild.roleIndex.update(after)
+
+@client.event
+async def on_raw_member_remove(payload):
+    # The raw event is used since the member may not be cached
+    guild = guildFor(payload.guild_id)
+    if guild != None:
+        guild.roleIndex.remove(payload.user.id)
+
+# Only enabled with the slim member cache, where discord.py doesn't dispatch updates to members it hasn't cached
+# Gets every gateway frame as the raw JSON text, so only member updates are parsed
+@client.event
+async def on_socket_raw_receive(frame):
+    if not isinstance(frame, str) or '"GUILD_MEMBER_UPDATE"' not in frame:
+        return
+
+    event = json.loads(frame)
+    if event.get('t') != 'GUILD_MEMBER_UPDATE':
+        return
 
-            # Get the list of users who reacted
-            users = [u async for u in r.users()]
+    data = event['d']
+    guild = guildFor(int(data['guild_id']))
+    if guild == None:
+        return
+
+    # Keep the role index up to date when someone's roles or name change
+    user = data['user']
+    name = data.get('nick') or user.get('global_name') or user.get('username')
+    guild.roleIndex.set(int(user['id']), guild.roleIndex.maskOfIDs(int(roleID) for roleID in data.get('roles', [])), name)
 
-            # Iterate through each user
-            for u in users:
-                if u.id == user.id:
-                    # It matches, so remove it
-                    await r.remove(user)
-                    return
+@client.event
+@timed(handlerSeconds, handlerErrors, handler='on_raw_reaction_add')
+async def on_raw_reaction_add(payload):
+    # Ignore the bot's own reactions
+    if payload.user_id == client.user.id:
+        return
 
-@tasks.loop(minutes=1)
-async def hourly():
-    global votes
+    # Only count reactions on bills that are still open
+    guild = guildFor(payload.guild_id)
+    chamber = guild.chamber(payload.channel_id) if guild != None else None
+    if chamber == None:
+        return
 
-    # A list of votes to remove
-    remove = []
+    vote = guild.votes.get(chamber, payload.message_id)
+    if vote == None or vote.endTime <= time.time():
+        return
 
-    # Automatically check votes once every hour
-    for i in range(len(votes['votes'])):
-        vote = votes['votes'][i]
+    # Without the member cache, use the roles sent with the reaction to catch anything the role index missed
+    if SLIM_MEMBER_CACHE and payload.member != None:
+        guild.roleIndex.update(payload.member)
 
-        # Check if the time has expired yet
-        endTime = datetime.fromtimestamp(int(vote['end_time']))
+    # Only count valid emojis from people with the right role
+    emoji = str(payload.emoji)
+    if emoji not in VOTE_EMOJIS or payload.member == None or not canVote(guild, payload.member, chamber):
+        return
 
-        # Skip until later if it hasn't
-        if endTime > datetime.now():
-            continue
+    # Count the vote
+    previous = guild.tallies.add(chamber, payload.message_id, payload.user_id, VOTE_EMOJIS.index(emoji), getParty(guild, payload.member))
 
+    # Only allow 1 reaction, so remove the one they voted with before
+    # (the tally ignores the removal event since it's no longer their vote)
+    if previous != None and previous != VOTE_EMOJIS.index(emoji):
+        message = client.get_channel(payload.channel_id).get_partial_message(payload.message_id)
+        guild.moderation.remove(message, VOTE_EMOJIS[previous], payload.member, priority=HIGH)
+
+@client.event
+@timed(handlerSeconds, handlerErrors, handler='on_raw_reaction_remove')
+async def on_raw_reaction_remove(payload):
+    guild = guildFor(payload.guild_id)
+    chamber = guild.chamber(payload.channel_id) if guild != None else None
+    if chamber == None:
+        return
+
+    emoji = str(payload.emoji)
+    if emoji not in VOTE_EMOJIS:
+        return
+
+    # Take the vote away (if it's the one they currently have)
+    guild.tallies.remove(chamber, payload.message_id, payload.user_id, VOTE_EMOJIS.index(emoji))
+
+# Fetch the voting message for a bill in a chamber (None if it can't be fetched)
+async def fetchBill(guild, chamber, messageID):
+    channel = client.get_channel(guild.channelID(chamber))
+
+    try:
+        return await guild.limiter.call('fetch_message', channel.id, channel.fetch_message, messageID)
+    except Exception as e:
+        # Print the error
+        print(e)
+        return None
+
+# Close every vote in a sim that has expired
+@timed(closeSeconds, handlerErrors, handler='closeVotes')
+async def closeVotes(guild):
+    # Make sure the seats are available before closing anything
+    # If they aren't this raises and the scheduler tries again later
+    guild.congress.refresh()
+
+    # Take every vote that has expired out of the registry
+    due = guild.votes.popDue(time.time())
+
+    # Nothing to do (and nothing to save) if none have
+    if len(due) == 0:
+        return
+
+    # Count the votes on every bill that's closing
+    bills = [(chamber, vote.messageIDs[chamber]) for vote in due for chamber in vote.chambers()]
+    results = dict(zip(bills, getVotes(guild, bills)))
+
+    # Fetch every voting message at once
+    messages = dict(zip(bills, await asyncio.gather(*[fetchBill(guild, chamber, messageID) for chamber, messageID in bills])))
+
+    # Each vote with results to post and the role they mention, in the same order the votes ended
+    posts = []
+
+    # The closed bills to add to the archive
+    archived = []
+
+    # How everyone in each chamber voted on them, for the voting record
+    records = []
+    closedAt = time.time()
+
+    for vote in due:
         # Whether to skip the vote for now
         skip = False
 
+        # The results in each chamber, for the archive
+        breakdown = {}
+
         # The message to send. Start out with the summary in bold.
-        resultsMsg = '**{}**'.format(vote['summary'])
+        resultsMsg = '**{}**'.format(vote.summary)
 
         # Whether the bill had a majority in both chambers (or only one if limited)
         majority = True
@@ -338,348 +706,561 @@ async def hourly():
         houseMajority = True
         senateTied = False
 
-        for cid in [SENATE_VOTING, HOUSE_VOTING]:
-            # Get whether it's in the house or senate
-            chamber = 'senate' if cid == SENATE_VOTING else 'house'
-
+        for chamber in ['senate', 'house']:
             # Skip incorrect channel
-            if (vote['type'] == 'senate' and cid == HOUSE_VOTING) or (vote['type'] == 'house' and cid == SENATE_VOTING):
+            if (vote.type == 'senate' and chamber == 'house') or (vote.type == 'house' and chamber == 'senate'):
                 continue
 
-            # Get the channel
-            channel = client.get_channel(cid)
-
-            # Get the message
-            message = None
-            try:
-                # Get the message
-                message = await channel.fetch_message(vote['message_ids'][chamber])
-
-                # Get the votes on it
-                votesOnBill = await getVotes(message, chamber)
-
-                # Check if it has a majority
-                if votesOnBill[0] <= votesOnBill[2]:
-                    majority = False
-                    
-                    if cid == HOUSE_VOTING:
-                        houseMajority = False
-                    elif votesOnBill[0] == votesOnBill[2]:
-                        senateTied = True
-
-                # Get percentages
-                pct = []
-                voteSum = sum(votesOnBill)
-
-                if voteSum == 0:
-                    # If no one voted, default to 0% to avoid error
-                    pct = [0, 0, 0]
-                else:
-                    for v in votesOnBill:
-                        pct.append(round(v / voteSum * 100, 2))
-
-                # Add the results to the message
-                resultsMsg = '{}\n{}\n{} Results:\n✅ Yes: {}% ({}) | 🟨 Present: {}% ({}) | ❌ No: {}% ({})\n[Link to bill]({})'.format(resultsMsg, DIVIDER, chamber.title(), pct[0], votesOnBill[0], pct[1], votesOnBill[1], pct[2], votesOnBill[2], message.jump_url)
-
-                # Schedule the vote for removal
-                remove.append(i)
-            except Exception as e:
-                # Print the error
-                print(e)
+            # Get the message (fetched above)
+            message = messages[(chamber, vote.messageIDs[chamber])]
 
-                # Ignore it if the message no longer exists
-                remove.append(i)
+            # Ignore it if the message no longer exists
+            if message == None:
                 skip = True
                 break
 
+            # Get the votes on it
+            votesOnBill = results[(chamber, vote.messageIDs[chamber])]
+            breakdown[chamber] = {'totals': votesOnBill, 'parties': guild.tallies.counts(chamber, vote.messageIDs[chamber]), 'url': message.jump_url}
+
+            # Everyone who voted, and everyone in the chamber who didn't
+            voters = dict(guild.tallies.voters(chamber, vote.messageIDs[chamber]))
+            absent = {memberID: partyOf(guild, memberID) for memberID in guild.roleIndex.members(chamberRole(chamber)) if memberID not in voters}
+            records.append((vote.key(), chamber, voters, absent))
+
+            # Check if it has a majority
+            if votesOnBill[0] <= votesOnBill[2]:
+                majority = False
+                
+                if chamber == 'house':
+                    houseMajority = False
+                elif votesOnBill[0] == votesOnBill[2]:
+                    senateTied = True
+
+            # Get percentages
+            pct = []
+            voteSum = sum(votesOnBill)
+
+            if voteSum == 0:
+                # If no one voted, default to 0% to avoid error
+                pct = [0, 0, 0]
+            else:
+                for v in votesOnBill:
+                    pct.append(round(v / voteSum * 100, 2))
+
+            # Add the results to the message
+            resultsMsg = '{}\n{}\n{} Results:\n✅ Yes: {}% ({}) | 🟨 Present: {}% ({}) | ❌ No: {}% ({})\n[Link to bill]({})'.format(resultsMsg, DIVIDER, chamber.title(), pct[0], votesOnBill[0], pct[1], votesOnBill[1], pct[2], votesOnBill[2], message.jump_url)
+
             # Skip the message if it's empty for whatever reason
             if len(message.content) == 0:
-                remove.append(i)
                 skip = True
                 break
 
         if skip:
+            # Don't record the votes on a bill that's being skipped
+            records = [record for record in records if record[0] != vote.key()]
             continue
 
-        # Get the legislative record channel
-        recordChannel = client.get_channel(LEGISLATIVE_RECORD)
-        
+        # The role to mention (once per digest)
+        mention = None
         if majority:
             # Mention the President role if it passed (ignoring supermajority requirements)
-            resultsMsg = '{}\n{}\n<@&{}>'.format(resultsMsg, DIVIDER, PRESIDENT_ROLE)
+            resultsMsg = '{}\nSent to the President'.format(resultsMsg)
+            mention = guild.config.roles['PRESIDENT']
         elif senateTied and houseMajority:
             # Mention the VP role if they need to break a tie in the Senate (only if it passed the house or the house wasn't asked)
-            resultsMsg = '{}\n{}\n<@&{}>'.format(resultsMsg, DIVIDER, VP_ROLE)
+            resultsMsg = '{}\nNeeds the Vice President to break the tie'.format(resultsMsg)
+            mention = guild.config.roles['VP']
 
         # Add a divider to the end
         resultsMsg = '{}\n{}'.format(resultsMsg, DIVIDER)
 
-        # Send the message
-        await recordChannel.send(resultsMsg)
+        posts.append((vote, resultsMsg, mention))
+
+        # Archive the full text of the bill (everything in the voting message before the divider)
+        first = messages[(vote.chambers()[0], vote.messageIDs[vote.chambers()[0]])]
+        text = first.content.split('\n' + DIVIDER)[0]
+        introduced = discord.utils.snowflake_time(first.id).timestamp()
+        archived.append(ArchivedBill(vote.key(), vote.type, vote.summary, text, breakdown, majority, introduced, vote.endTime, closedAt))
+
+    # Queue the results for the legislative record, where ones closing together are merged into digests
+    # Wait until they've been posted before removing the votes from storage
+    delivered = await asyncio.gather(*[guild.outbox.post(guild.config.legislativeRecord, resultsMsg, mention=mention) for _, resultsMsg, mention in posts])
+
+    # The votes whose results couldn't be posted stay open (and in storage) so they're posted next time
+    unsent = [vote for (vote, _, _), sent in zip(posts, delivered) if not sent]
+    unsentKeys = {vote.key() for vote in unsent}
+    closed = [vote for vote in due if vote.key() not in unsentKeys]
+
+    # Stop keeping track of the votes on the closed bills
+    for vote in closed:
+        for chamber in vote.chambers():
+            guild.tallies.drop(chamber, vote.messageIDs[chamber])
+
+    # Archive them and add them to the voting record, then remove the closed votes from storage
+    await guild.archive.add(*[bill for bill in archived if bill.id not in unsentKeys])
+    await guild.record.add(*[record for record in records if record[0] not in unsentKeys])
+    await guild.storage.delete(*closed)
+    billsClosed.inc(len(closed))
+
+    if len(unsent) > 0:
+        # Put them back and let the scheduler try again after a delay
+        for vote in unsent:
+            guild.votes.add(vote)
+        raise RuntimeError('Couldn\'t post the results of {} vote(s) to the legislative record'.format(len(unsent)))
+
+# Return the votes on a list of bills in a sim given as (chamber, message ID) pairs
+# Every bill is worked out at once from the live tallies
+def getVotes(guild, bills):
+    batch = []
+
+    for chamber, messageID in bills:
+        # Get the number of votes from each party
+        # Order corresponds with VOTE_EMOJIS
+        reactions = guild.tallies.counts(chamber, messageID)
+
+        # Get the list of seats by party in the respective chamber
+        seats = guild.congress.seats(chamber)
+
+        parties = list(reactions.keys())
+        batch.append(([reactions[party] for party in parties], [seats.get(party, 0) for party in parties]))
+
+    # Allocate the NPCs and add everything up (ties go to present)
+    return billTotals(batch, len(VOTE_EMOJIS), present=1).tolist()
+
+# Randomize the BP and return it as a file to send (None if it couldn't be loaded)
+def getBP():
+    # Randomize the BP
+    try:
+        normalized = basePartisanship.randomize()
+    except PartisanshipError as e:
+        print(e)
+        return None
+
+    # Send it as a file without saving it to disk
+    return discord.File(basePartisanship.toCSV(normalized), filename='new_bp.csv')
+
+# How many bills !searchbills shows
+SEARCH_RESULTS = 5
+
+# Search the archive of closed bills
+@commandRegistry.command('searchbills', parser=str.strip)
+async def searchBills(message, cmd, terms):
+    # Make sure there's something to search for
+    if len(terms) == 0:
+        await message.reply('Please provide something to search for. Example: `!searchbills healthcare reform`')
+        return
 
-    # Remove votes
-    
-    remove = sorted(list(set(remove)), reverse=True)
-    if len(votes['votes']) > 0:
-        for i in remove:
-            votes['votes'].pop(i)
-
-    # Save any changes to the json file
-    with open('votes.json', 'w') as f:
-        json.dump(votes, f)
-
-# Return the votes from a message
-async def getVotes(message, chamber):
-    # Get the list of reactions on the message
-    # Order corresponds with VOTE_EMOJIS
-    reactions = {}
-
-    for reaction in message.reactions:
-        # Check if it's a valid emoji
-        if reaction.emoji not in VOTE_EMOJIS:
-            # Clear the emoji
-            await reaction.clear()
-            continue
+    found = await guildOf(message).archive.search(terms, SEARCH_RESULTS)
+    if len(found) == 0:
+        await message.reply('No bills found.')
+        return
 
-        users = [user async for user in reaction.users()]
+    lines = []
+    for bill, score in found:
+        # Show the totals in each chamber as yes-present-no
+        chambers = ' | '.join('{}: {}'.format(chamber.title(), '-'.join(str(v) for v in result['totals'])) for chamber, result in bill.results.items())
+        link = next(iter(bill.results.values()))['url']
+        lines.append('**{}**\n{}, closed <t:{}:d> | {} | [Link to bill](<{}>)'.format(bill.summary, 'Passed' if bill.passed else 'Failed', round(bill.closed), chambers, link))
+
+    reply = truncate('\n'.join(lines))
+
+    await message.reply(reply)
+
+# The chance a member votes on a bill, from their voting record
+# One vote and one absence are added so members without a record start at 50%
+def turnoutChance(guild, memberID):
+    totals = guild.record.member(memberID)
+    if totals == None:
+        return 0.5
+    return (totals['voted'] + 1) / (totals['eligible'] + 2)
+
+# Get what's needed to forecast a bill in each of its chambers: the votes from each party so far, the chance
+# each member of the party who hasn't voted yet will, and the seats each party has
+def forecastInputs(guild, vote):
+    chambers = {}
+
+    for chamber in vote.chambers():
+        messageID = vote.messageIDs[chamber]
+        voters = guild.tallies.voters(chamber, messageID)
+        counts = guild.tallies.counts(chamber, messageID)
+        seats = guild.congress.seats(chamber)
+
+        turnout = {party: [] for party in PARTIES}
+        for memberID in guild.roleIndex.members(chamberRole(chamber)):
+            if memberID not in voters:
+                turnout[partyOf(guild, memberID)].append(turnoutChance(guild, memberID))
+
+        chambers[chamber] = ([counts.get(party, [0] * len(VOTE_EMOJIS)) for party in PARTIES], [turnout[party] for party in PARTIES], [seats.get(party, 0) for party in PARTIES])
+
+    return chambers
+
+# Show the chance each open bill passes, from the votes so far
+@commandRegistry.command('forecast')
+async def forecastCommand(message, cmd, args):
+    guild = guildOf(message)
+
+    # Make sure the seats are available
+    try:
+        guild.congress.refresh()
+    except CongressConfigError as e:
+        await message.reply(str(e))
+        return
 
-        for user in users:
-            member = message.guild.get_member(user.id)
+    # Soonest to close first
+    votes = sorted(guild.votes, key=lambda vote: vote.endTime)
+    if len(votes) == 0:
+        await message.reply('There are no open bills.')
+        return
 
-            # Skip the bot's own reactions
-            if user == client.user:
-                continue
+    guild.forecasts.prune({vote.key() for vote in votes})
 
-            # Iterate through each user's roles
-            valid = False
-            party = None
-
-            if member != None:
-                for role in member.roles:
-                    # Check for chamber-specific role
-                    if role.id == (SENATOR_ROLE if chamber == 'senate' else REP_ROLE):
-                        valid = True
-
-                    # Check for party role
-                    if role.id == DEM_ROLE:
-                        party = 'DEM'
-                    elif role.id == PDU_ROLE:
-                        party = 'PDU'
-                    elif role.id == NR_ROLE:
-                        party = 'NR'
-                    elif role.id == CON_ROLE:
-                        party = 'CON'
-                    elif role.id == IND_ROLE:
-                        party = 'IND'
-
-                    # Break once both have been found
-                    if valid and party != None:
-                        break
-
-            # Remove reactions from users without the correct role
-            if not valid:
-                await reaction.remove(user)
-                continue
+    # Only simulate the bills whose votes (or seats) have changed since they were last forecast
+    forecasts = {}
+    stale = []
+    for vote in votes:
+        versions = [guild.tallies.version(chamber, vote.messageIDs[chamber]) for chamber in vote.chambers()]
+        version = (tuple(versions), tuple(tuple(guild.congress.seatList(chamber)) for chamber in vote.chambers()))
+
+        forecast = guild.forecasts.get(vote.key(), version)
+        if forecast == None:
+            stale.append((vote, version, [vote.key()] + versions, forecastInputs(guild, vote)))
+        else:
+            forecasts[vote.key()] = forecast
+
+    # Run the simulations off the event loop
+    if len(stale) > 0:
+        results = await asyncio.get_running_loop().run_in_executor(None, lambda: [forecastBill(inputs, seed, present=1) for _, _, seed, inputs in stale])
+        for (vote, version, _, _), forecast in zip(stale, results):
+            guild.forecasts.put(vote.key(), version, forecast)
+            forecasts[vote.key()] = forecast
+
+    lines = []
+    for vote in votes:
+        forecast = forecasts[vote.key()]
+
+        # The chance it passes each chamber and the range the margin (yes - no) is likely to end up in
+        chambers = ' | '.join('{}: {}% to pass, margin {:+.0f} ({:+.0f} to {:+.0f})'.format(chamber.title(), round(chance * 100), margin[1], margin[0], margin[2]) for chamber, (chance, margin) in forecast.chambers.items())
 
-            # If they don't have a party role, default to IND
-            if party == None:
-                party = 'IND'
+        outcome = 'Passes: {}%'.format(round(forecast.passChance * 100))
+        if vote.type != 'house':
+            outcome = '{} | VP tie-break: {}%'.format(outcome, round(forecast.tieChance * 100))
 
-            # Count the reaction
-            if not party in reactions.keys():
-                reactions[party] = [0, 0, 0]
-            reactions[party][VOTE_EMOJIS.index(reaction.emoji)] += 1
+        lines.append('**{}** (closes <t:{}:R>)\n{}\n{}'.format(vote.summary, round(vote.endTime), chambers, outcome))
 
-    # Get the list of seats by party in the respective chamber
-    seats = {}
+    reply = truncate('\n'.join(lines))
 
-    if os.path.isfile('congress_config.csv'):
-        file = open('congress_config.csv', 'r')
-        reader = csv.reader(file)
-        lines = [row for row in reader]
+    await message.reply(reply)
 
-        for i in range(len(lines[0])):
-            if i > 0:
-                seats[lines[0][i]] = lines[1 if chamber == 'senate' else 2][i]
+# Matches a member mention or ID
+MEMBER_ID = re.compile(r'^(?:<@!?(\d+)>|(\d+))$')
+
+# Parse the member given to !record
+def parseMember(text):
+    match = MEMBER_ID.match(text.strip())
+    if match == None:
+        raise ArgumentError('Please mention a member. Example: `!record @member`')
+
+    return int(match.group(1) or match.group(2))
+
+# Show a member's attendance and how often they vote with their party
+@commandRegistry.command('record', parser=parseMember)
+async def recordCommand(message, cmd, memberID):
+    guild = guildOf(message)
+    totals = guild.record.member(memberID)
+
+    name = displayName(guild, message.guild, memberID)
+    if name == None:
+        name = 'That member'
+
+    if totals == None or totals['eligible'] == 0:
+        await message.reply(f'{name} hasn\'t been able to vote on any closed bills.')
+        return
+
+    # Attendance is how many of the bills they could vote on that they did
+    attendance = round(totals['voted'] / totals['eligible'] * 100, 1)
+    choices = ' | '.join('{} {}'.format(emoji, count) for emoji, count in zip(VOTE_EMOJIS, totals['choices']))
+
+    # Only bills where their party had a clear majority one way count towards voting with it
+    if totals['lineVotes'] > 0:
+        partyLine = '{}% ({}/{})'.format(round(totals['onLine'] / totals['lineVotes'] * 100, 1), totals['onLine'], totals['lineVotes'])
     else:
-        print('Error: please create congress_config.csv!')
-        exit()
+        partyLine = 'N/A'
 
+    await message.reply('**{}** ({})\nAttendance: {}% ({}/{} bills)\n{}\nVotes with their party: {}'.format(name, partyOf(guild, memberID), attendance, totals['voted'], totals['eligible'], choices, partyLine))
 
-    # Get the total number of votes
-    totalVotes = [0, 0, 0]
+# Parse the party given to !cohesion
+def parseParty(text):
+    party = text.strip().upper()
+    if party not in PARTIES:
+        raise ArgumentError('Please provide a party ({}). Example: `!cohesion DEM`'.format(', '.join(PARTIES)))
 
-    # Iterate through reactions dict
-    for party in reactions.keys():
-        # Get the reactions
-        partyReact = reactions[party]
+    return party
 
-        # Get the total number of reactions from that party
-        total = sum(partyReact)
+# Show how united a party has been on closed bills (the average Rice index: 1 is everyone voting the same way, 0 is an even split)
+@commandRegistry.command('cohesion', parser=parseParty)
+async def cohesionCommand(message, cmd, party):
+    cohesion = guildOf(message).record.cohesion(party)
 
-        # Get the number of seats for that party
-        npcNum = seats[party] - total
-        
-        # If the total is 0, i.e. no one voted, count every NPC as voting present
-        if total == 0:
-            totalVotes[1] += npcNum
-            continue
+    lines = []
+    for chamber in ['senate', 'house', 'overall']:
+        bills, rice = cohesion[chamber]
+        lines.append('{}: {} ({} bills)'.format(chamber.title(), 'N/A' if rice == None else '{:.2f}'.format(rice), bills))
 
-        # Add them to the total
-        totalVotes[0] += partyReact[0]
-        totalVotes[1] += partyReact[1]
-        totalVotes[2] += partyReact[2]
+    await message.reply('**{} cohesion** (Rice index)\n{}'.format(party, '\n'.join(lines)))
 
-        # Get the quotients
-        quotients = [npcNum * (partyReact[0] / total), npcNum * (partyReact[1] / total), npcNum * (partyReact[2] / total)]
+# Show how long each handler, command and API call has been taking
+@commandRegistry.command('stats', check=verifyPermission)
+async def statsCommand(message, cmd, args):
+    lines = []
+    for histogram, labelName in [(handlerSeconds, 'handler'), (closeSeconds, 'handler'), (commandSeconds, 'command'), (apiSeconds, 'route')]:
+        lines.extend(formatTable(histogram, labelName))
+        lines.append('')
 
-        # Get the initial allocation
-        initial = [math.floor(quotients[0]), math.floor(quotients[1]), math.floor(quotients[2])]
+    lines.append('Open votes: {} | Bills closed: {}'.format(len(guildOf(message).votes), sum(billsClosed.values.values())))
 
-        # Add this to the total
-        totalVotes[0] += initial[0]
-        totalVotes[1] += initial[1]
-        totalVotes[2] += initial[2]
+    # Show what's been blocking the event loop
+    if watchdog != None:
+        lines.append('')
+        lines.append('Event loop lag p99: {:.1f}ms | max: {:.1f}ms'.format(loopLag.quantile(0.99) * 1000, max([data[3] for data in loopLag.values.values()], default=0) * 1000))
+        for where, count, total, longest in watchdog.offenders():
+            lines.append('{}x {:.0f}ms (max {:.0f}ms) {}'.format(count, total * 1000, longest * 1000, where))
 
-        # Get how many NPCs are left
-        npcsLeft = npcNum - sum(initial)
+    reply = truncate('\n'.join(lines), '\n...')
 
-        # Skip the rest if we've already allocated all of the NPCs (unlikely)
-        if npcsLeft == 0:
-            continue
+    await message.reply(f'```\n{reply}\n```')
 
-        # Get the decimals
-        decimals = [quotients[0] - initial[0], quotients[1] - initial[1], quotients[2] - initial[2]]
-
-        if npcsLeft == 3:
-            # If there's 3 left, give each 1 vote
-            totalVotes[0] += 1
-            totalVotes[1] += 1
-            totalVotes[2] += 1
-        elif npcsLeft == 2:
-            # If there's 2 left, find the lowest decimal and give the other two one vote each
-
-            # Get the lowest decimal
-            lowestDec = min(decimals)
-
-            # Get a list of indexes that match
-            lowest = []
-            for i in range(3):
-                if decimals[i] == lowestDec:
-                    lowest.append(i)
-
-            # Add 1 vote for each that don't match
-            for i in range(3):
-                if i != lowest[0]:
-                    totalVotes[i] += 1
-
-            # Handle ties by voting present
-            if len(lowest) > 1:
-                n = len(lowest) - 1
-                totalVotes[1] += n
-        elif npcsLeft == 1:
-            # If there's only 1 left, find the highest decimal and give the vote to it
-
-            # Get the highest decimal
-            highestDec = max(decimals)
-
-            # Get a list of indexes that match
-            highest = []
-            for i in range(3):
-                if decimals[i] == highestDec:
-                    highest.append(i)
-
-            if len(highest) == 1:
-                # Give them the vote
-                totalVotes[highest[0]] += 1
-            else:
-                # Handle ties by voting present
-                totalVotes[1] += 1
-        else:
-            # There should never be more than 3 left, so give an error
-            print('Error: more than 3 left')
+# Simulate a batch of elections from the base partisanship and reply with the results
+@commandRegistry.command('simulate', parser=splitArgs, check=verifyPermission, cooldown=30)
+async def simulateElections(replyTo, cmd, args):
+    # Make sure there's a number of runs (and optionally a seed)
+    if len(args) == 0 or len(args) > 2:
+        await replyTo.reply('Please provide how many elections to simulate. Example: `!simulate 1000` (add a seed to repeat a previous run: `!simulate 1000 42`)')
+        return
+
+    try:
+        runs = int(args[0])
+        seed = int(args[1]) if len(args) == 2 else random.randrange(2 ** 32)
+    except ValueError:
+        await replyTo.reply('The number of runs and the seed must be whole numbers.')
+        return
 
-    # Return the votes
-    return totalVotes
+    if runs < 1 or runs > MAX_SIMULATIONS:
+        await replyTo.reply(f'The number of runs must be between 1 and {MAX_SIMULATIONS}.')
+        return
+    elif seed < 0:
+        await replyTo.reply('The seed can\'t be negative.')
+        return
 
-async def getBP(replyTo):
     # Load BP
-    basePartisanship = {}
+    try:
+        basePartisanship.refresh()
+    except PartisanshipError as e:
+        print(e)
+        await replyTo.reply(str(e))
+        return
 
-    if os.path.isfile('base_partisanship.csv'):
-        file = open('base_partisanship.csv', 'r')
-        reader = csv.reader(file)
-        lines = [row for row in reader]
+    states = basePartisanship.states
+    parties = basePartisanship.parties
 
-        for i in range(len(lines[0])):
-            if i > 0:
-                for line in lines[1:]:
-                    if not line[0] in basePartisanship:
-                        basePartisanship[line[0]] = {}
+    # Run the simulations in other processes so the bot stays responsive
+    async with replyTo.channel.typing():
+        winChance, percentiles, expectedSeats = await simulate(basePartisanship.values, runs, seed)
 
-                    basePartisanship[line[0]][lines[0][i]] = float(line[i])
-    else:
-        print('Error: please create base_partisanship.csv!')
-        return
+    # Send the results
+    header, table = resultsTable(parties, winChance, percentiles)
+    seats = ' | '.join(f'{party}: {expected:.1f}' for party, expected in zip(parties, expectedSeats))
+    await replyTo.reply(f'Simulated {runs} elections (seed {seed})\nExpected seats: {seats}', file=discord.File(writeCSV(states, header, table), filename='simulation.csv'))
+
+# Rebuild the tallies from the reactions on every open bill in a sim
+# This picks up any votes that were made while the bot was offline
+async def reconcileTallies(guild):
+    for vote in guild.votes:
+        for chamber in vote.chambers():
+            # Get the message
+            channel = client.get_channel(guild.channelID(chamber))
+            try:
+                message = await guild.limiter.call('fetch_message', channel.id, channel.fetch_message, vote.messageIDs[chamber])
+            except Exception as e:
+                print(e)
+                continue
+
+            voters = {}
+
+            for reaction in message.reactions:
+                # Check if it's a valid emoji
+                if reaction.emoji not in VOTE_EMOJIS:
+                    # Clear the emoji
+                    guild.moderation.clear(message, reaction.emoji, priority=LOW)
+                    continue
 
-    # Apply randomness
-    randomized = {}
+                # Users are fetched 100 at a time
+                fetched = 0
+                async for user in reaction.users():
+                    if fetched % 100 == 0:
+                        apiCalls.inc(route='reaction_users')
+                    fetched += 1
 
-    for state in basePartisanship.keys():
-        randomized[state] = {}
-        for party in basePartisanship[state].keys():
-            value = basePartisanship[state][party]
-            randomized[state][party] = random.gauss(value, 0.03 * value)
+                    # Skip the bot's own reactions
+                    if user == client.user:
+                        continue
 
-    # Normalize each state
-    normalized = {}
-    for state in randomized.keys():
-        normalized[state] = {}
-        total = 0
+                    # Remove reactions from users without the correct role
+                    # (checked with the role index so it works without the member cache)
+                    if not canVote(guild, user, chamber):
+                        guild.moderation.remove(message, reaction.emoji, user, priority=NORMAL)
+                        continue
 
-        for value in randomized[state].values():
-            total += value
+                    # Only allow 1 reaction, so keep the first one found and remove the rest
+                    if user.id in voters:
+                        guild.moderation.remove(message, reaction.emoji, user, priority=HIGH)
+                        continue
 
-        for party in randomized[state].keys():
-            normalized[state][party] = randomized[state][party] / total
+                    voters[user.id] = (VOTE_EMOJIS.index(reaction.emoji), getParty(guild, user))
 
-    # Get the text to save
-    text = 'STATE,'
+            guild.tallies.replace(chamber, message.id, voters)
 
-    for party in normalized[list(normalized.keys())[0]].keys():
-        text += '{},'.format(party)
+# Slash commands
+# These work the same as the text commands but don't need the message content intent
 
-    text = text[:-1]
-    text += '\n'
+# Check if the user of a slash command is an admin or mod
+async def verifyInteraction(interaction):
+    guild = guildFor(interaction.guild_id)
+    roleFound = guild != None and guild.roleIndex.has(interaction.user.id, 'ADMIN', 'MOD')
 
-    for state in normalized.keys():
-        text += '{},'.format(state)
+    # Tell the user permission was denied
+    if not roleFound:
+        await interaction.response.send_message('Permission denied.', ephemeral=True)
+
+    return roleFound
+
+@tree.error
+async def on_app_command_error(interaction, error):
+    if isinstance(error, app_commands.CommandOnCooldown):
+        text = 'Please wait {} more seconds before using this command again.'.format(math.ceil(error.retry_after))
+    elif isinstance(error, app_commands.CheckFailure):
+        # The check has already told them
+        return
+    else:
+        print(error)
+        text = 'Something went wrong.'
+
+    if interaction.response.is_done():
+        await interaction.followup.send(text, ephemeral=True)
+    else:
+        await interaction.response.send_message(text, ephemeral=True)
+
+@tree.command(name='vote', description='Start a vote on a bill')
+@app_commands.describe(bill='What to vote on', chamber='Which chambers vote on it')
+@app_commands.guild_only()
+@timed(commandSeconds, handlerErrors, command='/vote')
+async def voteSlash(interaction, bill: str, chamber: Literal['both', 'senate', 'house'] = 'both'):
+    guild = guildFor(interaction.guild_id)
+
+    # Check if it's in the correct channel
+    if guild == None or not inVotingChannel(guild, chamber, interaction.channel_id):
+        await interaction.response.send_message('Incorrect channel.', ephemeral=True)
+        return
+
+    # Make sure there's actually a message
+    if len(bill.strip()) == 0:
+        await interaction.response.send_message('Please specify something to vote on.', ephemeral=True)
+        return
 
-        for party in normalized[state].keys():
-            text += '{},'.format(normalized[state][party])
+    # Posting the bill and adding the emojis takes longer than Discord waits for a response, so answer later
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    await introduceBills(guild, interaction.user.name, chamber, [bill])
+    await interaction.followup.send('Vote started.', ephemeral=True)
+
+@tree.command(name='chance', description='Roll a random chance')
+@app_commands.describe(chance='The percentage chance of success')
+@timed(commandSeconds, handlerErrors, command='/chance')
+async def chanceSlash(interaction, chance: app_commands.Range[float, 0, 100]):
+    # Run the random chance and tell the user
+    await interaction.response.send_message(str(random.random() < chance / 100))
+
+@tree.command(name='getbp', description='Generate a randomized base partisanship')
+@app_commands.guild_only()
+@app_commands.check(verifyInteraction)
+@app_commands.checks.cooldown(1, 5, key=lambda interaction: interaction.user.id)
+@timed(commandSeconds, handlerErrors, command='/getbp')
+async def getBPSlash(interaction):
+    await interaction.response.defer(thinking=True)
+
+    bp = getBP()
+    if bp == None:
+        await interaction.followup.send('The base partisanship couldn\'t be loaded.')
+        return
+
+    await interaction.followup.send(file=bp)
+
+@tree.command(name='countmessages', description='Count how many messages each member has sent in this channel')
+@app_commands.describe(page='Which page of members to show', sort='How to sort the members')
+@app_commands.guild_only()
+@app_commands.check(verifyInteraction)
+@app_commands.checks.cooldown(1, 10, key=lambda interaction: interaction.user.id)
+@timed(commandSeconds, handlerErrors, command='/countmessages')
+async def countMessagesSlash(interaction, page: app_commands.Range[int, 1] = 1, sort: Literal['count', 'name'] = 'count'):
+    # Counting a channel's history can take a while, so answer later
+    await interaction.response.defer(thinking=True)
+    await countActivity(interaction.channel)
+    await interaction.followup.send(countPage(interaction.channel_id, page, sort))
+
+@client.event
+async def setup_hook():
+    global synced
+
+    for guild in guilds.values():
+        # Load the votes that were open when the bot last stopped
+        await guild.open(VOTE_STORAGE)
 
-        text = text[:-1]
-        text += '\n'
+        # Load the seats in each chamber
+        try:
+            guild.congress.refresh()
+        except CongressConfigError as e:
+            print(e)
 
-    with open('new_bp.csv', 'w') as f:
-        f.write(text)
+    # Load the message counts
+    await activity.load()
 
-    #print(message)
-    #return
+    # Serve metrics locally if enabled
+    if METRICS_PORT != None:
+        await metrics.serve('127.0.0.1', int(METRICS_PORT))
 
-    # Send the message
-    #resultsChannel = client.get_channel(ELECTION_RESULTS_CHANNEL)
-    #await resultsChannel.send(message)
+    # Watch for anything blocking the event loop if enabled
+    if watchdog != None:
+        watchdog.start()
 
-    await replyTo.reply(file=discord.File('new_bp.csv'))
+    # Register the slash commands with Discord (only needed once, when the bot starts)
+    if not synced:
+        await tree.sync()
+        synced = True
 
 @client.event
 async def on_ready():
     # Tell us when the bot is online
     print(f'{client.user} is online!')
-    
-    # Start the hourly loop
-    hourly.start()
+
+    # Index everyone's roles (servers without their own config all share the one from the environment)
+    # Without the member cache, each server's members are requested once and only the ones with a sim role are kept
+    members = {}
+    for server in client.guilds:
+        guild = guildFor(server.id)
+        if guild != None:
+            members.setdefault(guild, []).extend(await server.chunk(cache=False) if SLIM_MEMBER_CACHE else server.members)
+
+    for guild, guildMembers in members.items():
+        guild.roleIndex.seed(guildMembers)
+
+    # Let go of the full member objects before catching up
+    members = None
+
+    # Catch up on any votes made while we were offline, in every sim at once
+    await asyncio.gather(*[reconcileTallies(guild) for guild in guilds.values()])
+
+    # Start closing votes as they end
+    for guild in guilds.values():
+        guild.closer.start()
 
 # Main entry point
 def main():
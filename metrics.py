@@ -0,0 +1,171 @@
+import functools
+import time
+from aiohttp import web
+
+# The upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+# Turn a dict of labels into the Prometheus format
+def formatLabels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"')) for name, value in labels) + '}'
+
+
+# A number that only goes up, counted separately for each set of labels
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+
+        # labels -> count
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in self.values.items():
+            lines.append(f'{self.name}{formatLabels(labels)} {value}')
+        return lines
+
+
+# A number that can go up and down, read from a function whenever it's needed
+class Gauge:
+    def __init__(self, name, help, func):
+        self.name = name
+        self.help = help
+        self.func = func
+
+    def render(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge', f'{self.name} {self.func()}']
+
+
+# How long something took, counted into buckets separately for each set of labels
+class Histogram:
+    def __init__(self, name, help, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+
+        # labels -> [bucket counts, count, sum, max]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        if key not in self.values:
+            self.values[key] = [[0] * len(self.buckets), 0, 0, 0]
+
+        data = self.values[key]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                data[0][i] += 1
+                break
+        data[1] += 1
+        data[2] += value
+        data[3] = max(data[3], value)
+
+    # Estimate a quantile from the buckets (returns the upper bound of the bucket it falls in, capped at the max)
+    def quantile(self, q, **labels):
+        data = self.values.get(tuple(sorted(labels.items())))
+        if data is None or data[1] == 0:
+            return 0
+
+        target = q * data[1]
+        seen = 0
+        for bound, count in zip(self.buckets, data[0]):
+            seen += count
+            if seen >= target:
+                return min(bound, data[3])
+        return data[3]
+
+    # Get (labels, count, sum, max) for every set of labels
+    def summary(self):
+        return [(dict(labels), data[1], data[2], data[3]) for labels, data in self.values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, count, total, _) in self.values.items():
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets, counts):
+                cumulative += bucketCount
+                lines.append(f'{self.name}_bucket{formatLabels(labels + (("le", bound),))} {cumulative}')
+            lines.append(f'{self.name}_bucket{formatLabels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{self.name}_sum{formatLabels(labels)} {total}')
+            lines.append(f'{self.name}_count{formatLabels(labels)} {count}')
+        return lines
+
+
+# Every metric the bot keeps
+class Metrics:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._metrics = []
+        self._runner = None
+
+    def counter(self, name, help):
+        metric = Counter(f'{self.prefix}_{name}', help)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, func):
+        metric = Gauge(f'{self.prefix}_{name}', help, func)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, buckets=BUCKETS):
+        metric = Histogram(f'{self.prefix}_{name}', help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    # Get every metric in the Prometheus text format
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    # Serve the metrics over HTTP at /metrics
+    async def serve(self, host, port):
+        async def handle(request):
+            return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handle)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+
+# Decorator that times a coroutine function and counts its errors
+def timed(histogram, errors, **labels):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                errors.inc(**labels)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+
+        return wrapper
+
+    return decorator
+
+
+# Format a histogram as a table of calls, average, 99th percentile and max (in milliseconds) for !stats
+def formatTable(histogram, labelName):
+    lines = ['{:<24} {:>7} {:>8} {:>8} {:>8}'.format(labelName, 'calls', 'avg ms', 'p99 ms', 'max ms')]
+
+    for labels, count, total, maximum in sorted(histogram.summary(), key=lambda row: -row[2]):
+        name = labels.get(labelName, '')
+        lines.append('{:<24} {:>7} {:>8.1f} {:>8.1f} {:>8.1f}'.format(name[:24], count, total / count * 1000, histogram.quantile(0.99, **labels) * 1000, maximum * 1000))
+
+    return lines
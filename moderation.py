@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+
+# Priorities for queued removals (lower goes first)
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+# How many removals can be waiting on the rate limiter at once
+WORKERS = 4
+
+
+# A reaction (or every reaction with an emoji, if user is None) waiting to be removed from a message
+class Removal:
+    __slots__ = ('priority', 'seq', 'message', 'emoji', 'user', 'cancelled')
+
+    def __init__(self, priority, seq, message, emoji, user):
+        self.priority = priority
+        self.seq = seq
+        self.message = message
+        self.emoji = emoji
+        self.user = user
+
+        # Set when a clear of the same emoji makes this unnecessary
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+# Removes invalid reactions in the background, most important first
+# Each (message, emoji, user) is only queued once, and removals are collapsed into one clear when every reaction with an emoji is invalid
+# Queueing never waits, so event handlers aren't held up by the rate limits
+class ModerationQueue:
+    def __init__(self, limiter, workers=WORKERS):
+        self.limiter = limiter
+        self.workers = workers
+
+        # Removals waiting to be made, most important first (cancelled ones are skipped when they come up)
+        self._heap = []
+
+        # (message ID, emoji, user ID or None) -> removal
+        self._pending = {}
+
+        # (message ID, emoji) -> user IDs with removals pending
+        self._byReaction = {}
+
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._tasks = []
+
+        # How many removals are being made right now, and an event set whenever there's nothing left to do
+        self._active = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def __len__(self):
+        return len(self._pending)
+
+    # Queue removing a user's reaction
+    # If clearable is set, every reaction with this emoji on the message is invalid, so they're all cleared at once
+    def remove(self, message, emoji, user, priority=NORMAL, clearable=False):
+        if clearable:
+            self.clear(message, emoji, priority)
+            return
+
+        emoji = str(emoji)
+
+        # Already queued (or the whole emoji is being cleared)
+        if (message.id, emoji, user.id) in self._pending or (message.id, emoji, None) in self._pending:
+            return
+
+        self._push(Removal(priority, next(self._seq), message, emoji, user))
+        self._byReaction.setdefault((message.id, emoji), set()).add(user.id)
+
+    # Queue removing every reaction with an emoji from a message
+    def clear(self, message, emoji, priority=LOW):
+        emoji = str(emoji)
+        key = (message.id, emoji, None)
+
+        existing = self._pending.get(key)
+        if existing is not None:
+            # Already queued, but it may need to go sooner
+            if priority >= existing.priority:
+                return
+            existing.cancelled = True
+
+        # The clear takes care of any removals of this emoji that are still waiting
+        for userID in self._byReaction.pop((message.id, emoji), ()):
+            self._pending.pop((message.id, emoji, userID)).cancelled = True
+
+        self._push(Removal(priority, next(self._seq), message, emoji, None))
+
+    def _push(self, removal):
+        self._pending[(removal.message.id, removal.emoji, removal.user.id if removal.user is not None else None)] = removal
+        heapq.heappush(self._heap, removal)
+        self._wake.set()
+        self._idle.clear()
+
+        # Start the workers if they aren't running
+        self._tasks = [task for task in self._tasks if not task.done()]
+        loop = asyncio.get_running_loop()
+        while len(self._tasks) < self.workers:
+            self._tasks.append(loop.create_task(self._work()))
+
+    # Wait until every queued removal has been made
+    async def join(self):
+        await self._idle.wait()
+
+    # Stop removing reactions (anything still queued is dropped)
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        self._heap = []
+        self._pending.clear()
+        self._byReaction.clear()
+        self._active = 0
+        self._idle.set()
+
+    # Take the most important removal that's still needed (None if there isn't one)
+    def _next(self):
+        while self._heap:
+            removal = heapq.heappop(self._heap)
+            if removal.cancelled:
+                continue
+
+            userID = removal.user.id if removal.user is not None else None
+            del self._pending[(removal.message.id, removal.emoji, userID)]
+            if userID is not None:
+                users = self._byReaction.get((removal.message.id, removal.emoji))
+                users.discard(userID)
+                if not users:
+                    del self._byReaction[(removal.message.id, removal.emoji)]
+
+            return removal
+
+        return None
+
+    async def _work(self):
+        while True:
+            removal = self._next()
+            if removal is None:
+                if self._active == 0:
+                    self._idle.set()
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            message = removal.message
+            self._active += 1
+            try:
+                if removal.user is None:
+                    await self.limiter.call('clear', message.channel.id, message.clear_reaction, removal.emoji)
+                else:
+                    await self.limiter.call('reaction', message.channel.id, message.remove_reaction, removal.emoji, removal.user)
+            except Exception as e:
+                # The message may have been deleted or the reaction already removed
+                print(e)
+            finally:
+                self._active -= 1
+                if self._active == 0 and not self._pending:
+                    self._idle.set()
@@ -0,0 +1,166 @@
+import asyncio
+import heapq
+import itertools
+
+# Priorities for queued posts (lower goes first)
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+# Discord's message length limit
+MESSAGE_LIMIT = 2000
+
+# How long to wait for more posts to the same channel before sending, in seconds
+COALESCE_WINDOW = 1
+
+# How many times to try sending a digest that's being rate limited or hitting server errors
+MAX_ATTEMPTS = 5
+
+# How long to wait before the first retry (doubled after each one), in seconds
+RETRY_BASE = 1
+
+
+# A single queued post
+class Post:
+    __slots__ = ('priority', 'seq', 'body', 'mention', 'delivered')
+
+    def __init__(self, priority, seq, body, mention, delivered):
+        self.priority = priority
+        self.seq = seq
+        self.body = body
+
+        # Role ID to mention (or None)
+        self.mention = mention
+
+        # Future set to whether the post was sent
+        self.delivered = delivered
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+# Check if a failed send is worth trying again (rate limited or a server error)
+def isRetryable(e):
+    status = getattr(e, 'status', None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+# Queues messages for channels and merges the ones posted close together into digests
+# Each digest mentions every role its posts asked for once, at the end
+class Outbox:
+    def __init__(self, limiter, getChannel, window=COALESCE_WINDOW, limit=MESSAGE_LIMIT):
+        self.limiter = limiter
+
+        # Function that gets a channel from its ID
+        self.getChannel = getChannel
+
+        self.window = window
+        self.limit = limit
+
+        # channel ID -> heap of posts waiting to be sent
+        self._pending = {}
+
+        self._seq = itertools.count()
+        self._wake = asyncio.Event()
+        self._worker = None
+
+    # Queue a post for a channel
+    # Returns a future that's set to whether it was sent
+    def post(self, channelID, body, mention=None, priority=NORMAL):
+        loop = asyncio.get_running_loop()
+        delivered = loop.create_future()
+
+        heapq.heappush(self._pending.setdefault(channelID, []), Post(priority, next(self._seq), body, mention, delivered))
+        self._wake.set()
+
+        # Start sending if nothing is yet
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+
+        return delivered
+
+    # Stop sending (anything still queued is marked as not sent)
+    def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            self._worker = None
+
+        for posts in self._pending.values():
+            for post in posts:
+                if not post.delivered.done():
+                    post.delivered.set_result(False)
+        self._pending.clear()
+
+    # Get the line mentioning a set of roles
+    def _footer(self, mentions):
+        return ' '.join(f'<@&{role}>' for role in mentions)
+
+    # Merge posts into as few messages as fit within the limit
+    # Returns (text, posts) for each message
+    def _digests(self, posts):
+        digests = []
+        lines = []
+        mentions = []
+        included = []
+
+        def finish():
+            text = '\n'.join(lines + ([self._footer(mentions)] if mentions else []))
+            digests.append((text[:self.limit], included))
+
+        for post in posts:
+            newMentions = mentions + ([post.mention] if post.mention is not None and post.mention not in mentions else [])
+            length = len('\n'.join(lines + [post.body] + ([self._footer(newMentions)] if newMentions else [])))
+
+            # Start a new message if this one doesn't fit
+            if included and length > self.limit:
+                finish()
+                lines, mentions, included = [], [], []
+                newMentions = [post.mention] if post.mention is not None else []
+
+            lines.append(post.body)
+            mentions = newMentions
+            included.append(post)
+
+        if included:
+            finish()
+
+        return digests
+
+    # Send a message, retrying with backoff while it's rate limited
+    async def _send(self, channelID, text):
+        channel = self.getChannel(channelID)
+        delay = RETRY_BASE
+
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                await self.limiter.call('send', channelID, channel.send, text)
+                return True
+            except Exception as e:
+                if not isRetryable(e) or attempt == MAX_ATTEMPTS - 1:
+                    print(e)
+                    return False
+
+                # Wait as long as Discord asks (if it says) or back off
+                await asyncio.sleep(max(getattr(e, 'retry_after', 0) or 0, delay))
+                delay *= 2
+
+        return False
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+
+            # Give posts made close together a chance to be merged
+            await asyncio.sleep(self.window)
+            self._wake.clear()
+
+            # Take everything that's queued, sending the channel with the most urgent post first
+            pending = self._pending
+            self._pending = {}
+
+            for channelID, posts in sorted(pending.items(), key=lambda item: item[1][0]):
+                for text, included in self._digests(sorted(posts)):
+                    sent = await self._send(channelID, text)
+                    for post in included:
+                        if not post.delivered.done():
+                            post.delivered.set_result(sent)
@@ -0,0 +1,96 @@
+import csv
+import io
+import os
+import numpy as np
+
+# How much each value is randomized by, relative to its size
+NOISE = 0.03
+
+
+# Randomize a table of values and normalize each state so it adds up to 1
+# If runs is given, that many independent tables are drawn at once into an array of shape (runs, states, parties)
+def drawShares(values, rng, runs=None):
+    size = values.shape if runs is None else (runs,) + values.shape
+    randomized = rng.normal(values, NOISE * values, size=size)
+    return randomized / randomized.sum(axis=-1, keepdims=True)
+
+
+# Write a table with a row for every state as a csv file in memory
+def writeCSV(states, header, values):
+    text = io.StringIO()
+    writer = csv.writer(text, lineterminator='\n')
+
+    writer.writerow(['STATE'] + header)
+    for state, row in zip(states, values.tolist()):
+        writer.writerow([state] + row)
+
+    return io.BytesIO(text.getvalue().encode())
+
+
+# Raised when the base partisanship file is missing or invalid
+class PartisanshipError(Exception):
+    pass
+
+
+# The base partisanship of every state, loaded from base_partisanship.csv
+# The first row lists the parties and every other row is a state followed by its value for each party
+class BasePartisanship:
+    def __init__(self, path='base_partisanship.csv'):
+        self.path = path
+
+        # The state and party names in the order they appear in the file
+        self.states = []
+        self.parties = []
+
+        # Array of shape (states, parties)
+        self.values = None
+
+        self._mtime = None
+
+    # Parse and validate the file
+    def _parse(self):
+        with open(self.path, 'r', newline='') as f:
+            lines = [row for row in csv.reader(f) if len(row) > 0]
+
+        if len(lines) < 2 or len(lines[0]) < 2:
+            raise PartisanshipError(f'Error: {self.path} needs a party row and at least one state')
+
+        parties = lines[0][1:]
+        states = [line[0] for line in lines[1:]]
+
+        if any(len(line) != len(parties) + 1 for line in lines[1:]):
+            raise PartisanshipError(f'Error: every state in {self.path} must have a value for every party')
+
+        try:
+            values = np.array([line[1:] for line in lines[1:]], dtype=np.float64)
+        except ValueError:
+            raise PartisanshipError(f'Error: {self.path} must only contain numbers')
+
+        if (values < 0).any() or (values.sum(axis=1) <= 0).any():
+            raise PartisanshipError(f'Error: every state in {self.path} needs positive values')
+
+        return states, parties, values
+
+    # Reload the file if it has changed since it was last loaded
+    def refresh(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            raise PartisanshipError(f'Error: please create {self.path}!')
+
+        if mtime != self._mtime:
+            self.states, self.parties, self.values = self._parse()
+            self._mtime = mtime
+
+    # Get a randomized copy of the values, normalized so each state adds up to 1
+    def randomize(self, rng=None):
+        self.refresh()
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        return drawShares(self.values, rng)
+
+    # Write a table of values for every state as a csv file in memory
+    def toCSV(self, values):
+        return writeCSV(self.states, self.parties, values)
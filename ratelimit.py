@@ -0,0 +1,74 @@
+import asyncio
+import time
+from collections import deque
+
+# How many calls each kind of route allows and over how many seconds
+# Discord gives each route its own bucket per channel (the "major parameter"), so these are tracked per channel too
+ROUTE_LIMITS = {
+    'fetch_message': (5, 1),
+    'send': (5, 5),
+    'reaction': (1, 0.25),
+    'delete': (5, 1)
+}
+
+# The limit used for any route not listed above
+DEFAULT_LIMIT = (5, 5)
+
+
+# Spaces out API calls so they stay within Discord's per-route rate limits
+# Also limits how many calls can be in flight at once across every route
+# Pass limits=None to only limit how many calls are in flight
+class RouteLimiter:
+    def __init__(self, concurrency=8, limits=ROUTE_LIMITS, observer=None):
+        self.limits = limits
+
+        # Function called with (route, seconds, whether it failed) after every call
+        self.observer = observer
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+        # (route, channel ID) -> start times of the most recent calls (each in a list so it can be updated)
+        self._buckets = {}
+        self._locks = {}
+
+    # Wait until there's room in a route's bucket
+    # Returns the slot taken in the bucket, which holds when the call started
+    async def _acquire(self, route, major):
+        if self.limits is None:
+            return [0]
+
+        calls, per = self.limits.get(route, DEFAULT_LIMIT)
+        key = (route, major)
+
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            starts = self._buckets.setdefault(key, deque(maxlen=calls))
+
+            # If the bucket is full, wait for the oldest call to fall out of the window
+            if len(starts) == calls:
+                wait = starts[0][0] + per - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+
+            slot = [time.monotonic()]
+            starts.append(slot)
+            return slot
+
+    # Call a coroutine function once there's room for it
+    # Waiting for the route's bucket doesn't take up one of the in-flight calls, so a busy route can't hold up the others
+    async def call(self, route, major, func, *args, **kwargs):
+        slot = await self._acquire(route, major)
+
+        async with self._semaphore:
+            # Count the window from when the call actually starts
+            slot[0] = time.monotonic()
+
+            start = time.perf_counter()
+            failed = False
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                if self.observer is not None:
+                    self.observer(route, time.perf_counter() - start, failed)
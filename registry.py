@@ -0,0 +1,120 @@
+import heapq
+
+# The chambers a bill can be voted on in
+CHAMBERS = ('senate', 'house')
+
+
+# A single bill that is being voted on
+class VoteRecord:
+    __slots__ = ('type', 'messageIDs', 'summary', 'endTime')
+
+    def __init__(self, type, messageIDs, summary, endTime):
+        # Either 'both', 'senate' or 'house'
+        self.type = type
+
+        # The ID of the voting message in each chamber (None if it isn't voted on there)
+        self.messageIDs = messageIDs
+
+        # The summary to post in the legislative record
+        self.summary = summary
+
+        # When the vote ends as a unix timestamp
+        self.endTime = int(endTime)
+
+    # Get the chambers this bill is being voted on in
+    def chambers(self):
+        return [chamber for chamber in CHAMBERS if self.messageIDs.get(chamber) is not None]
+
+    # A unique key for the record (the ID of its first voting message)
+    def key(self):
+        return self.messageIDs[self.chambers()[0]]
+
+    # Create a record from an entry in votes.json
+    @classmethod
+    def fromDict(cls, data):
+        return cls(data['type'], dict(data['message_ids']), data['summary'], data['end_time'])
+
+    # Convert the record back to an entry in votes.json
+    def toDict(self):
+        return {
+            'type': self.type,
+            'message_ids': dict(self.messageIDs),
+            'summary': self.summary,
+            'end_time': str(self.endTime)
+        }
+
+
+# Keeps track of every open vote, indexed by message ID and end time
+class VoteRegistry:
+    def __init__(self):
+        # Every record in the order they were added (dicts keep insertion order)
+        self._records = {}
+
+        # (chamber, message ID) -> record
+        self._byMessage = {}
+
+        # Min-heap of (end time, insertion number, record)
+        # Removed records are left in the heap and skipped when they reach the top
+        self._deadlines = []
+        self._counter = 0
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(list(self._records))
+
+    def __contains__(self, record):
+        return record in self._records
+
+    # Add a new vote
+    def add(self, record):
+        self._records[record] = None
+
+        for chamber in record.chambers():
+            self._byMessage[(chamber, record.messageIDs[chamber])] = record
+
+        heapq.heappush(self._deadlines, (record.endTime, self._counter, record))
+        self._counter += 1
+
+    # Remove a vote
+    def remove(self, record):
+        if record not in self._records:
+            return
+
+        del self._records[record]
+
+        for chamber in record.chambers():
+            key = (chamber, record.messageIDs[chamber])
+            if self._byMessage.get(key) is record:
+                del self._byMessage[key]
+
+    # Find the vote that a message belongs to
+    def get(self, chamber, messageID):
+        return self._byMessage.get((chamber, messageID))
+
+    # Drop removed records from the top of the heap
+    def _prune(self):
+        while self._deadlines and self._deadlines[0][2] not in self._records:
+            heapq.heappop(self._deadlines)
+
+    # Get the earliest end time of any open vote (None if there aren't any)
+    def nextEndTime(self):
+        self._prune()
+
+        if not self._deadlines:
+            return None
+        return self._deadlines[0][0]
+
+    # Remove and return every vote that has ended, earliest first
+    def popDue(self, now):
+        due = []
+
+        self._prune()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            record = heapq.heappop(self._deadlines)[2]
+            self.remove(record)
+            due.append(record)
+            self._prune()
+
+        return due
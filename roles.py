@@ -0,0 +1,118 @@
+# What the bot keeps about a member with at least one of the roles it cares about
+class MemberRecord:
+    __slots__ = ('id', 'name', 'mask')
+
+    def __init__(self, id, name, mask):
+        self.id = id
+
+        # Their display name when they were last seen (None if it isn't known)
+        self.name = name
+
+        # Which of the roles they have
+        self.mask = mask
+
+
+# Keeps track of which members have the roles the bot cares about
+# Each member's roles are stored as a bitmask, with one bit for each role
+# Only members with at least one of the roles are kept, so it's small enough to use instead of discord.py's member cache
+class RoleIndex:
+    def __init__(self, roles):
+        # role name -> bit
+        self._names = {}
+
+        # role ID -> bits for every name that uses it
+        self._bits = {}
+
+        for i, (name, roleID) in enumerate(roles.items()):
+            self._names[name] = 1 << i
+            self._bits[roleID] = self._bits.get(roleID, 0) | (1 << i)
+
+        # member ID -> record
+        self._records = {}
+
+        # role name -> set of member IDs
+        self._members = {name: set() for name in roles}
+
+    def __len__(self):
+        return len(self._records)
+
+    # Work out the bitmask for a list of roles
+    def maskOf(self, roles):
+        return self.maskOfIDs(role.id for role in roles)
+
+    # Work out the bitmask for a list of role IDs
+    def maskOfIDs(self, roleIDs):
+        mask = 0
+        for roleID in roleIDs:
+            mask |= self._bits.get(roleID, 0)
+        return mask
+
+    # Add or update a member
+    def update(self, member):
+        self.set(member.id, self.maskOf(getattr(member, 'roles', [])), getattr(member, 'display_name', None))
+
+    # Set a member's bitmask directly (and their name, if it's given)
+    def set(self, memberID, mask, name=None):
+        record = self._records.get(memberID)
+        old = record.mask if record is not None else 0
+
+        # Only touch the sets for roles that changed
+        changed = old ^ mask
+        if changed:
+            for roleName, bit in self._names.items():
+                if changed & bit:
+                    if mask & bit:
+                        self._members[roleName].add(memberID)
+                    else:
+                        self._members[roleName].discard(memberID)
+
+        if not mask:
+            self._records.pop(memberID, None)
+        elif record is None:
+            self._records[memberID] = MemberRecord(memberID, name, mask)
+        else:
+            record.mask = mask
+            if name is not None:
+                record.name = name
+
+    # Remove a member
+    def remove(self, memberID):
+        self.set(memberID, 0)
+
+    # Rebuild the index from every member in a guild
+    def seed(self, members):
+        self._records = {}
+        self._members = {name: set() for name in self._names}
+
+        for member in members:
+            self.update(member)
+
+    # Get a member's bitmask
+    def mask(self, memberID):
+        record = self._records.get(memberID)
+        return record.mask if record is not None else 0
+
+    # Get a member's display name (None if they don't have any of the roles or it isn't known)
+    def name(self, memberID):
+        record = self._records.get(memberID)
+        return record.name if record is not None else None
+
+    # Check if a member has any of the given roles
+    def has(self, memberID, *names):
+        mask = self.mask(memberID)
+        for name in names:
+            if mask & self._names[name]:
+                return True
+        return False
+
+    # Get the first of the given roles that a member has (None if they have none of them)
+    def first(self, memberID, names):
+        mask = self.mask(memberID)
+        for name in names:
+            if mask & self._names[name]:
+                return name
+        return None
+
+    # Get the IDs of every member with a role
+    def members(self, name):
+        return self._members[name]
@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+# The longest the scheduler will sleep before checking again, in seconds
+# This keeps it accurate if the system clock is changed while it's asleep
+MAX_SLEEP = 3600
+
+# How long to wait before trying again if the callback fails, in seconds
+RETRY_DELAY = 60
+
+
+# Sleeps until the earliest deadline, then runs a callback
+class DeadlineScheduler:
+    def __init__(self, nextDeadline, callback):
+        # Function that returns the earliest deadline as a unix timestamp (or None if there isn't one)
+        self.nextDeadline = nextDeadline
+
+        # Coroutine function to run once that deadline has been reached
+        self.callback = callback
+
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    # Start the scheduler (does nothing if it's already running)
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    # Stop the scheduler
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # Wake the scheduler up so it picks up a new or changed deadline
+    def rearm(self):
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            # Work out how long until the next deadline
+            deadline = self.nextDeadline()
+            if deadline is None:
+                delay = MAX_SLEEP
+            else:
+                delay = min(deadline - time.time(), MAX_SLEEP)
+
+            # Sleep until then, unless something new gets scheduled first
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self.callback()
+            except Exception as e:
+                # Print the error but keep the scheduler alive
+                print(e)
+
+                # Give whatever went wrong a chance to be fixed before trying again
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), RETRY_DELAY)
+                except asyncio.TimeoutError:
+                    pass
@@ -0,0 +1,112 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from partisanship import drawShares
+
+# How many elections each worker simulates at a time
+# This is fixed so the same seed always gives the same results no matter how many workers there are
+CHUNK_SIZE = 500
+
+# Which percentiles of the vote share to report
+PERCENTILES = [5, 50, 95]
+
+# How many bins each vote share is counted in for the percentiles (each is 0.1 points wide)
+SHARE_BINS = 1000
+
+# The process pool used to run simulations (created the first time it's needed)
+_executor = None
+
+
+def getExecutor():
+    global _executor
+
+    if _executor is None:
+        # Spawn fresh worker processes rather than forking the bot
+        workers = int(os.getenv('SIM_WORKERS', os.cpu_count() or 1))
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    return _executor
+
+
+# Simulate a chunk of elections and count the results (runs in a worker process)
+# Only the counts are sent back, so the bot never has every simulated election in memory at once
+# Returns how many times each party won each state and how many times each party's share in each state fell in each bin
+def _runChunk(values, seedSequence, runs):
+    rng = np.random.default_rng(seedSequence)
+    shares = drawShares(values, rng, runs)
+    states, parties = values.shape
+
+    # Find the winner of each state in each election
+    winners = shares.argmax(axis=2)
+    wins = np.stack([(winners == party).sum(axis=0) for party in range(parties)], axis=1)
+
+    # Count the shares in each bin (a chunk is small enough for the counts to fit in 16 bits)
+    bins = np.clip((shares * SHARE_BINS).astype(np.int64), 0, SHARE_BINS - 1)
+    cells = np.arange(states * parties).reshape(states, parties) * SHARE_BINS
+    histogram = np.bincount((cells + bins).ravel(), minlength=states * parties * SHARE_BINS).astype(np.uint16)
+
+    return wins, histogram.reshape(states, parties, SHARE_BINS)
+
+
+# Work out the statistics from the counts for every simulated election
+def _summarize(wins, histogram, runs):
+    winChance = wins / runs
+
+    # Find the bin each percentile falls in, then how far into it (assuming the shares in a bin are spread evenly)
+    cumulative = histogram.cumsum(axis=2)
+    percentiles = []
+    for percentile in PERCENTILES:
+        rank = percentile / 100 * runs
+        index = np.minimum((cumulative < rank).sum(axis=2), SHARE_BINS - 1)[..., None]
+
+        count = np.take_along_axis(histogram, index, axis=2)[..., 0]
+        before = np.take_along_axis(cumulative, index, axis=2)[..., 0] - count
+        fraction = np.where(count > 0, (rank - before) / np.maximum(count, 1), 0.5)
+
+        percentiles.append((index[..., 0] + np.clip(fraction, 0, 1)) / SHARE_BINS)
+
+    # Each state is one seat, so the expected number of seats is the sum of the chances of winning them
+    expectedSeats = winChance.sum(axis=0)
+
+    return winChance, np.stack(percentiles), expectedSeats
+
+
+# Simulate a number of elections from a table of base partisanship values
+# Returns the chance each party wins each state, their vote share percentiles in each state and their expected seats
+async def simulate(values, runs, seed):
+    loop = asyncio.get_running_loop()
+
+    # Split the runs into chunks, each with its own seed derived from the main one
+    sizes = [CHUNK_SIZE] * (runs // CHUNK_SIZE)
+    if runs % CHUNK_SIZE > 0:
+        sizes.append(runs % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    # Run the chunks in parallel, adding up their counts as they finish
+    wins = np.zeros(values.shape, dtype=np.int64)
+    histogram = np.zeros(values.shape + (SHARE_BINS,), dtype=np.int32)
+    for chunk in asyncio.as_completed([loop.run_in_executor(getExecutor(), _runChunk, values, chunkSeed, size) for chunkSeed, size in zip(seeds, sizes)]):
+        chunkWins, chunkHistogram = await chunk
+        wins += chunkWins
+        histogram += chunkHistogram
+
+    # Summarize them off the event loop
+    return await loop.run_in_executor(None, _summarize, wins, histogram, runs)
+
+
+# Turn the statistics into a table with a row per state and columns for each party
+def resultsTable(parties, winChance, percentiles):
+    header = []
+    columns = []
+
+    for i, party in enumerate(parties):
+        header.append(f'{party} WIN %')
+        columns.append(winChance[:, i] * 100)
+
+        for percentile, values in zip(PERCENTILES, percentiles):
+            header.append(f'{party} P{percentile}')
+            columns.append(values[:, i])
+
+    return header, np.round(np.stack(columns, axis=1).astype(np.float64), 4)
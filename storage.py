@@ -0,0 +1,170 @@
+import json
+import os
+from abc import ABC, abstractmethod
+from fileio import FileWorker, openDatabase
+from registry import VoteRecord
+
+
+# Base class for somewhere to keep votes
+# All file I/O happens on the storage's worker thread
+class VoteStorage(ABC):
+    def __init__(self):
+        self._worker = FileWorker()
+
+    # Get every stored vote, oldest first
+    async def load(self):
+        return await self._worker.run(self._load)
+
+    # Store new votes
+    async def insert(self, *records):
+        await self._worker.run(self._insert, records)
+
+    # Remove votes
+    async def delete(self, *records):
+        await self._worker.run(self._delete, records)
+
+    # Finish any pending writes and release the file
+    async def close(self):
+        await self._worker.run(self._close)
+        self._worker.shutdown()
+
+    @abstractmethod
+    def _load(self):
+        pass
+
+    @abstractmethod
+    def _insert(self, records):
+        pass
+
+    @abstractmethod
+    def _delete(self, records):
+        pass
+
+    def _close(self):
+        pass
+
+
+# Stores votes in an SQLite database in WAL mode
+# Every change is its own transaction, so a crash can never leave half a write behind
+class SQLiteStorage(VoteStorage):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._conn = None
+
+    # Open the database (on the worker thread) the first time it's needed
+    def _connect(self):
+        if self._conn is None:
+            self._conn = openDatabase(self.path)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS votes (
+                    id INTEGER PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    senate_id INTEGER,
+                    house_id INTEGER,
+                    summary TEXT NOT NULL,
+                    end_time INTEGER NOT NULL
+                )
+            ''')
+            self._conn.commit()
+        return self._conn
+
+    # Convert a record to a database row
+    def _row(self, record):
+        return (record.type, record.messageIDs.get('senate'), record.messageIDs.get('house'), record.summary, record.endTime, record.key())
+
+    def _load(self):
+        rows = self._connect().execute('SELECT type, senate_id, house_id, summary, end_time FROM votes ORDER BY id').fetchall()
+        return [VoteRecord(row[0], {'senate': row[1], 'house': row[2]}, row[3], row[4]) for row in rows]
+
+    def _insert(self, records):
+        with self._connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO votes (type, senate_id, house_id, summary, end_time, id) VALUES (?, ?, ?, ?, ?, ?)', [self._row(record) for record in records])
+
+    def _delete(self, records):
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM votes WHERE id = ?', [(record.key(),) for record in records])
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # Move the votes from an old votes.json file into the database
+    # The file is renamed afterwards so it's only ever imported once
+    async def importJson(self, path):
+        return await self._worker.run(self._importJson, path)
+
+    def _importJson(self, path):
+        if not os.path.isfile(path):
+            return 0
+
+        with open(path, 'r') as f:
+            records = [VoteRecord.fromDict(vote) for vote in json.load(f).get('votes', [])]
+
+        self._insert(records)
+        os.replace(path, path + '.imported')
+        return len(records)
+
+
+# Stores votes in a json file in the same format as the original votes.json
+# The whole file is rewritten on every change, but it's written to a temporary file first so a crash can't corrupt it
+class JsonStorage(VoteStorage):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+        # key -> vote in the votes.json format
+        self._votes = None
+
+    def _read(self):
+        if self._votes is None:
+            self._votes = {}
+
+            if os.path.isfile(self.path):
+                with open(self.path, 'r') as f:
+                    for vote in json.load(f).get('votes', []):
+                        record = VoteRecord.fromDict(vote)
+                        self._votes[record.key()] = record.toDict()
+
+        return self._votes
+
+    def _write(self):
+        temp = self.path + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump({'votes': list(self._votes.values())}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+    def _load(self):
+        return [VoteRecord.fromDict(vote) for vote in self._read().values()]
+
+    def _insert(self, records):
+        votes = self._read()
+        for record in records:
+            votes[record.key()] = record.toDict()
+        self._write()
+
+    def _delete(self, records):
+        votes = self._read()
+        for record in records:
+            votes.pop(record.key(), None)
+        self._write()
+
+
+# Open the storage backend with the given name ('sqlite' or 'json')
+async def openStorage(kind, jsonPath='votes.json', dbPath='votes.db'):
+    if kind == 'json':
+        return JsonStorage(jsonPath)
+    elif kind == 'sqlite':
+        storage = SQLiteStorage(dbPath)
+
+        # Bring over any votes from before the database existed
+        imported = await storage.importJson(jsonPath)
+        if imported > 0:
+            print(f'Imported {imported} votes from {jsonPath}')
+
+        return storage
+    else:
+        raise ValueError(f'Unknown vote storage: {kind}')
@@ -0,0 +1,67 @@
+import itertools
+
+
+# Keeps a live count of who voted for what on each open bill
+class TallyEngine:
+    def __init__(self, options):
+        # How many options there are to vote for
+        self.options = options
+
+        # (chamber, message ID) -> {user ID: (choice, party)}
+        self._bills = {}
+
+        # (chamber, message ID) -> a number that changes whenever the votes on the bill do (never reused, so caches can tell)
+        self._versions = {}
+        self._counter = itertools.count(1)
+
+    def _changed(self, chamber, messageID):
+        self._versions[(chamber, messageID)] = next(self._counter)
+
+    # Record a user's vote, replacing any vote they already had on the bill
+    # Returns the choice they had before (None if they hadn't voted)
+    def add(self, chamber, messageID, userID, choice, party):
+        voters = self._bills.setdefault((chamber, messageID), {})
+        previous = voters.get(userID)
+        voters[userID] = (choice, party)
+        self._changed(chamber, messageID)
+        return previous[0] if previous is not None else None
+
+    # Remove a user's vote, but only if it's the choice that was taken away
+    # Returns whether anything was removed
+    def remove(self, chamber, messageID, userID, choice):
+        voters = self._bills.get((chamber, messageID))
+        if voters is None or userID not in voters or voters[userID][0] != choice:
+            return False
+
+        del voters[userID]
+        self._changed(chamber, messageID)
+        return True
+
+    # Replace every vote on a bill (used when reconciling with the reactions on the message)
+    def replace(self, chamber, messageID, voters):
+        self._bills[(chamber, messageID)] = dict(voters)
+        self._changed(chamber, messageID)
+
+    # Stop tracking a bill
+    def drop(self, chamber, messageID):
+        self._bills.pop((chamber, messageID), None)
+        self._versions.pop((chamber, messageID), None)
+
+    # Get the current version of the votes on a bill (0 if no one has voted on it yet)
+    def version(self, chamber, messageID):
+        return self._versions.get((chamber, messageID), 0)
+
+    # Get the voters on a bill as {user ID: (choice, party)}
+    def voters(self, chamber, messageID):
+        return self._bills.get((chamber, messageID), {})
+
+    # Get the number of votes for each option from each party on a bill
+    def counts(self, chamber, messageID):
+        counts = {}
+
+        for choice, party in self.voters(chamber, messageID).values():
+            if party not in counts:
+                counts[party] = [0] * self.options
+            counts[party][choice] += 1
+
+        return counts
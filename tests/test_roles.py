@@ -0,0 +1,54 @@
+from roles import RoleIndex
+
+ROLES = {'SENATOR': 1, 'REP': 2, 'DEM': 3, 'IND': 4}
+
+
+class Role:
+    def __init__(self, id):
+        self.id = id
+
+
+class Member:
+    def __init__(self, id, name, roles):
+        self.id = id
+        self.display_name = name
+        self.roles = [Role(roleID) for roleID in roles]
+
+
+def test_set_keeps_the_display_name():
+    index = RoleIndex(ROLES)
+    index.set(10, index.maskOfIDs([1, 3]), 'Alice')
+
+    assert index.name(10) == 'Alice'
+    assert index.has(10, 'SENATOR')
+    assert index.first(10, ['DEM', 'IND']) == 'DEM'
+    assert index.members('SENATOR') == {10}
+
+
+def test_update_keeps_the_display_name():
+    index = RoleIndex(ROLES)
+    index.update(Member(10, 'Alice', [1, 4]))
+    assert index.name(10) == 'Alice'
+
+    # Changing roles without a name keeps the old one
+    index.set(10, index.maskOfIDs([2, 4]))
+    assert index.name(10) == 'Alice'
+    assert index.members('SENATOR') == set()
+    assert index.members('REP') == {10}
+
+    # A new name replaces it
+    index.update(Member(10, 'Alicia', [2, 4]))
+    assert index.name(10) == 'Alicia'
+
+
+def test_members_without_roles_are_not_kept():
+    index = RoleIndex(ROLES)
+    index.update(Member(10, 'Alice', [1]))
+    index.update(Member(11, 'Bob', [99]))
+    assert len(index) == 1
+    assert index.name(11) is None
+
+    index.remove(10)
+    assert len(index) == 0
+    assert index.name(10) is None
+    assert index.members('SENATOR') == set()
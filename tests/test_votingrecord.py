@@ -0,0 +1,28 @@
+import asyncio
+from votingrecord import VotingRecord
+
+PARTIES = ['DEM', 'PDU', 'NR', 'CON', 'IND']
+
+
+def test_empty_chamber_is_skipped_and_reloads(tmp_path):
+    path = str(tmp_path / 'record.bin')
+
+    async def run():
+        record = VotingRecord(path, PARTIES, 3)
+        await record.load()
+
+        # No one has the role for the House, so it has no rows, but the bills after it still count
+        await record.add((1, 'senate', {5: (0, 'DEM')}, {6: 'DEM'}), (1, 'house', {}, {}), (2, 'senate', {5: (2, 'DEM')}, {}))
+
+        reloaded = VotingRecord(path, PARTIES, 3)
+        await reloaded.load()
+        return record, reloaded
+
+    record, reloaded = asyncio.run(run())
+
+    for totals in [record, reloaded]:
+        assert len(totals) == 3
+        assert totals.member(5) == {'eligible': 2, 'voted': 2, 'choices': [1, 0, 1], 'onLine': 2, 'lineVotes': 2}
+        assert totals.member(6)['voted'] == 0
+        assert totals.cohesion('DEM')['senate'] == (2, 1.0)
+        assert totals.cohesion('DEM')['house'] == (0, None)
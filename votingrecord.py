@@ -0,0 +1,205 @@
+import os
+import numpy as np
+from fileio import FileWorker
+
+# One row for each member who could vote on a bill in a chamber
+ROW = np.dtype([('bill', '<i8'), ('chamber', 'i1'), ('member', '<i8'), ('party', 'i1'), ('choice', 'i1')])
+
+# The choice stored for members who didn't vote
+ABSENT = -1
+
+# Chambers in the order they're numbered in the rows
+CHAMBERS = ['senate', 'house']
+
+# Columns of the per-member totals
+ELIGIBLE, VOTED, ON_LINE, LINE_VOTES = range(4)
+
+# How many rows or members to make room for at first
+INITIAL_CAPACITY = 1024
+
+
+# Every member's vote on every closed bill, plus totals that are kept up to date as bills close
+# The rows are kept in numpy arrays and appended to a binary file, and the totals are only ever added to,
+# so !record and !cohesion never need to go back through every bill
+class VotingRecord:
+    def __init__(self, path, parties, options):
+        self.path = path
+        self.parties = parties
+        self.options = options
+        self._worker = FileWorker()
+
+        # Every row so far (the first _size of them are used)
+        self._rows = np.zeros(INITIAL_CAPACITY, dtype=ROW)
+        self._size = 0
+
+        # The (bill, chamber) pairs that have been recorded, so a bill closed twice isn't counted twice
+        self._recorded = set()
+
+        # member ID -> row in _members and _choices
+        self._memberIndex = {}
+
+        # For each member: bills they could vote on, bills they voted on, times they voted with their party and times their party had a line
+        self._members = np.zeros((INITIAL_CAPACITY, 4), dtype=np.int64)
+
+        # For each member: how many times they made each choice
+        self._choices = np.zeros((INITIAL_CAPACITY, options), dtype=np.int64)
+
+        # For each party and chamber: how many bills it voted on and the sum of its Rice index on them
+        self._cohesionBills = np.zeros((len(parties), len(CHAMBERS)), dtype=np.int64)
+        self._cohesionSum = np.zeros((len(parties), len(CHAMBERS)))
+
+    def __len__(self):
+        return self._size
+
+    # Load the rows saved before and work out the totals from them
+    async def load(self):
+        rows = await self._worker.run(self._read)
+
+        # Add them up one bill at a time, the same way they were added as they closed
+        if len(rows) > 0:
+            starts = np.flatnonzero((rows['bill'][1:] != rows['bill'][:-1]) | (rows['chamber'][1:] != rows['chamber'][:-1])) + 1
+            for group in np.split(rows, starts):
+                self._apply(group)
+
+    def _read(self):
+        try:
+            data = np.fromfile(self.path, dtype=np.uint8)
+        except FileNotFoundError:
+            return np.zeros(0, dtype=ROW)
+
+        # Ignore a row that was only partly written when the bot stopped
+        usable = len(data) - len(data) % ROW.itemsize
+        return data[:usable].view(ROW)
+
+    def _append(self, rows):
+        with open(self.path, 'ab') as f:
+            rows.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    # Record the votes on bills that just closed, all in one write
+    # Each is (bill, chamber, voters, absent): voters is {member ID: (choice, party)} and absent is {member ID: party}
+    # for everyone else who could have voted
+    async def add(self, *bills):
+        groups = []
+        for bill, chamber, voters, absent in bills:
+            # Nothing to record if no one could vote on it (like a chamber no one has the role for)
+            if (bill, CHAMBERS.index(chamber)) in self._recorded or len(voters) + len(absent) == 0:
+                continue
+
+            rows = np.zeros(len(voters) + len(absent), dtype=ROW)
+            rows['bill'] = bill
+            rows['chamber'] = CHAMBERS.index(chamber)
+            rows['member'] = list(voters) + list(absent)
+            rows['party'] = [self.parties.index(party) for _, party in voters.values()] + [self.parties.index(party) for party in absent.values()]
+            rows['choice'] = [choice for choice, _ in voters.values()] + [ABSENT] * len(absent)
+            groups.append(rows)
+
+        if len(groups) == 0:
+            return
+
+        await self._worker.run(self._append, np.concatenate(groups))
+        for rows in groups:
+            self._apply(rows)
+
+    # Add one bill's rows to the totals
+    def _apply(self, rows):
+        if len(rows) == 0:
+            return
+
+        key = (int(rows['bill'][0]), int(rows['chamber'][0]))
+        if key in self._recorded:
+            return
+        self._recorded.add(key)
+
+        self._store(rows)
+
+        indexes = self._indexesOf(rows['member'])
+        voted = rows['choice'] != ABSENT
+        parties = rows['party'].astype(np.int64)
+        choices = rows['choice'].astype(np.int64)
+
+        # Attendance and choices
+        np.add.at(self._members[:, ELIGIBLE], indexes, 1)
+        np.add.at(self._members[:, VOTED], indexes[voted], 1)
+        np.add.at(self._choices, (indexes[voted], choices[voted]), 1)
+
+        # How each party voted
+        counts = np.zeros((len(self.parties), self.options), dtype=np.int64)
+        np.add.at(counts, (parties[voted], choices[voted]), 1)
+
+        # The party line is the choice most of the party made (no line if it was tied)
+        top = counts.max(axis=1)
+        line = np.where((counts == top[:, None]).sum(axis=1) == 1, counts.argmax(axis=1), ABSENT)
+        line[top == 0] = ABSENT
+
+        memberLine = line[parties]
+        hasLine = voted & (memberLine != ABSENT)
+        np.add.at(self._members[:, LINE_VOTES], indexes[hasLine], 1)
+        np.add.at(self._members[:, ON_LINE], indexes[hasLine & (choices == memberLine)], 1)
+
+        # Rice index of each party that voted yes or no: |yes - no| / (yes + no)
+        yes = counts[:, 0]
+        no = counts[:, self.options - 1]
+        decided = yes + no > 0
+        self._cohesionBills[decided, key[1]] += 1
+        self._cohesionSum[decided, key[1]] += np.abs(yes - no)[decided] / (yes + no)[decided]
+
+    # Keep the rows in memory
+    def _store(self, rows):
+        if self._size + len(rows) > len(self._rows):
+            grown = np.zeros(max(len(self._rows) * 2, self._size + len(rows)), dtype=ROW)
+            grown[:self._size] = self._rows[:self._size]
+            self._rows = grown
+
+        self._rows[self._size:self._size + len(rows)] = rows
+        self._size += len(rows)
+
+    # Get the rows in the totals for a list of member IDs, adding any new members
+    def _indexesOf(self, members):
+        indexes = np.empty(len(members), dtype=np.int64)
+        for i, member in enumerate(members.tolist()):
+            index = self._memberIndex.get(member)
+            if index is None:
+                index = len(self._memberIndex)
+                self._memberIndex[member] = index
+            indexes[i] = index
+
+        # Make room for the new members
+        if len(self._memberIndex) > len(self._members):
+            size = max(len(self._members) * 2, len(self._memberIndex))
+            self._members = np.concatenate([self._members, np.zeros((size - len(self._members), self._members.shape[1]), dtype=np.int64)])
+            self._choices = np.concatenate([self._choices, np.zeros((size - len(self._choices), self.options), dtype=np.int64)])
+
+        return indexes
+
+    # Get a member's totals (None if they've never been able to vote on a closed bill)
+    # Returns a dict with eligible, voted, choices (count of each), onLine and lineVotes
+    def member(self, memberID):
+        index = self._memberIndex.get(memberID)
+        if index is None:
+            return None
+
+        totals = self._members[index]
+        return {
+            'eligible': int(totals[ELIGIBLE]),
+            'voted': int(totals[VOTED]),
+            'choices': self._choices[index].tolist(),
+            'onLine': int(totals[ON_LINE]),
+            'lineVotes': int(totals[LINE_VOTES])
+        }
+
+    # Get a party's average Rice index in each chamber
+    # Returns chamber -> (bills, average), plus 'overall'
+    def cohesion(self, party):
+        index = self.parties.index(party)
+        bills = self._cohesionBills[index]
+        sums = self._cohesionSum[index]
+
+        result = {}
+        for i, chamber in enumerate(CHAMBERS):
+            result[chamber] = (int(bills[i]), float(sums[i] / bills[i]) if bills[i] > 0 else None)
+
+        total = int(bills.sum())
+        result['overall'] = (total, float(sums.sum() / total) if total > 0 else None)
+        return result